@@ -64,6 +64,12 @@ def main():
     parser_hide.add_argument("-s", "--shift", dest="shift", default=0,
                     help="Shift for the message to hide")
 
+    # Binary header instead of the decimal length
+    parser_hide.add_argument("-b", "--binary-header", dest="binary_header",
+                    action="store_true",
+                    help="Prefix the secret with a binary header (length and" +
+                    " CRC32). Files are then hidden as raw bytes.")
+
     # Subparser: Reveal
     parser_reveal = subparsers.add_parser('reveal', help='reveal help')
     parser_reveal.add_argument("-i", "--input", dest="input_image_file",
@@ -84,11 +90,15 @@ def main():
     if arguments.command == 'hide':
         if arguments.secret_message != None:
             secret = arguments.secret_message
+        elif arguments.secret_file != None and arguments.binary_header:
+            with open(arguments.secret_file, "rb") as f:
+                secret = f.read()
         elif arguments.secret_file != None:
             secret = tools.binary2base64(arguments.secret_file)
 
         img_encoded = lsb.hide(arguments.input_image_file, secret,
-                               arguments.encoding, int(arguments.shift))
+                               arguments.encoding, int(arguments.shift),
+                               binary_header=arguments.binary_header)
         try:
             img_encoded.save(arguments.output_image_file)
         except Exception as e:
@@ -99,7 +109,10 @@ def main():
         secret = lsb.reveal(arguments.input_image_file, arguments.encoding,
                             int(arguments.shift))
         if arguments.secret_binary != None:
-            data = tools.base642binary(secret)
+            if isinstance(secret, bytes):
+                data = secret
+            else:
+                data = tools.base642binary(secret)
             with open(arguments.secret_binary, "wb") as f:
                 f.write(data)
         else:
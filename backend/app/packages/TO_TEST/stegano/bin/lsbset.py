@@ -38,6 +38,8 @@ from stegano import tools
 
 import argparse
 
+# Generators bounded by default by the number of pixels of the image
+BOUNDED_GENERATORS = ["eratosthenes", "composite", "carmichael"]
 
 
 class ValidateGenerator(argparse.Action):
@@ -117,8 +119,12 @@ def main():
             exit(1)
 
         try:
-            if (arguments.generator_function[0] == "LFSR"):
-                # Compute the size of the image for use by the LFSR generator if needed
+            if (arguments.generator_function[0] in ["LFSR", "LFSR_galois"]) or (
+                arguments.generator_function[0] in BOUNDED_GENERATORS
+                and len(arguments.generator_function) == 1
+            ):
+                # Compute the size of the image for use by the LFSR generator
+                # and as the default bound of the sieves
                 tmp = tools.open_image(arguments.input_image_file)
                 size = tmp.width * tmp.height
                 tmp.close()
@@ -36,13 +36,19 @@ except:
 
 
 def main():
-    parser = argparse.ArgumentParser(prog='stegano-steganalysis-parity')
-    parser.add_argument("-i", "--input", dest="input_image_file",
-                    help="Image file")
-    parser.add_argument("-o", "--output", dest="output_image_file",
-                    help="Image file")
+    parser = argparse.ArgumentParser(prog='stegano-steganalysis-statistics')
+    parser.add_argument("-i", "--input", dest="input_image_files", nargs="+",
+                    help="Image files")
     arguments = parser.parse_args()
 
-    input_image_file = Image.open(arguments.input_image_file)
-    output_image = statistics.steganalyse(input_image_file)
-    output_image.save(arguments.output_image_file)
+    images = [Image.open(image_file) for image_file in arguments.input_image_files]
+    if len({image.size for image in images}) > 1:
+        analyses = [statistics.analyse(image) for image in images]
+    else:
+        batch = statistics.analyse(images)
+        analyses = [statistics.Statistics(*values) for values in zip(*batch)]
+    for image_file, analysis in zip(arguments.input_image_files, analyses):
+        print(image_file)
+        print("  Chi-square:", " ".join("{:.3f}".format(p) for p in analysis.chi_square))
+        print("  RS:", " ".join("{:.3f}".format(rate) for rate in analysis.rs))
+        print("  Score: {:.3f}".format(analysis.score))
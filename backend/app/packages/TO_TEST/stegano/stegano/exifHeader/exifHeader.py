@@ -25,66 +25,373 @@ __date__ = "$Date: 2016/05/26 $"
 __revision__ = "$Date: 2017/01/18 $"
 __license__ = "GPLv3"
 
+import contextlib
+import io
+import mmap
+import os
+import struct
+import zlib
+from typing import IO, Iterator, List, Optional, Sequence, Tuple, Union
+
 import piexif
+from PIL import Image
+
 from stegano import tools
 
+EXIF_HEADER = b"Exif\x00\x00"
+JPEG_SOI = b"\xff\xd8"
+TIFF_HEADERS = (b"II*\x00", b"MM\x00*")
+
+# JPEG markers
+APP0, APP1, SOS = 0xE0, 0xE1, 0xDA
+# Markers without length: TEM and RST0 to RST7
+STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+
+# The secret is compressed with zlib and split in chunks, each one prefixed
+# by this header: magic, index and number of chunks, compressed size.
+PAYLOAD_HEADER = struct.Struct(">8sHHI")
+PAYLOAD_MAGIC = b"STEGANO\x00"
+# Largest chunk held by an APP1 segment
+CHUNK_SIZE = 0xFFFF - 2 - PAYLOAD_HEADER.size
+# Size of the blocks given to the compressor
+BLOCK_SIZE = 2 ** 20
+
+# Content of a file, read or memory-mapped
+Buffer = Union[bytes, mmap.mmap]
+
+
+def _read_bytes(input_image_file: Union[str, IO[bytes], Image.Image]) -> Optional[bytes]:
+    """Content of an image file given by its location or as a file object, None
+    for an already opened Image.
+    """
+    if isinstance(input_image_file, Image.Image):
+        return None
+    if isinstance(input_image_file, (str, os.PathLike)):
+        with open(input_image_file, "rb") as f:
+            return f.read()
+    input_image_file.seek(0)
+    return input_image_file.read()
+
+
+@contextlib.contextmanager
+def _map_bytes(input_image_file: Union[str, IO[bytes]]) -> Iterator[Buffer]:
+    # Content of a file, memory-mapped when possible
+    f: IO[bytes]
+    if isinstance(input_image_file, (str, os.PathLike)):
+        f = open(input_image_file, "rb")
+    else:
+        f = input_image_file
+    try:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            # Not a file on disk, or an empty one
+            f.seek(0)
+            yield f.read()
+        else:
+            with data:
+                yield data
+    finally:
+        if f is not input_image_file:
+            f.close()
+
+
+def _write_bytes(img_enc: Union[str, IO[bytes]], data: bytes) -> None:
+    if isinstance(img_enc, (str, os.PathLike)):
+        with open(img_enc, "wb") as f:
+            f.write(data)
+    else:
+        img_enc.write(data)
+
+
+def jpeg_segments(data: Buffer) -> Iterator[Tuple[int, int, int]]:
+    """Marker, start and end of the segments of a JPEG, up to the start of scan
+    (SOS) segment included. The entropy-coded data is not read.
+    """
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            raise ValueError("Invalid JPEG marker at offset {}.".format(position))
+        marker = data[position + 1]
+        if marker == 0xFF:
+            # Fill byte
+            position += 1
+            continue
+        if marker in STANDALONE_MARKERS:
+            yield marker, position, position + 2
+            position += 2
+            continue
+        (length,) = struct.unpack_from(">H", data, position + 2)
+        yield marker, position, position + 2 + length
+        if marker == SOS:
+            return
+        position += 2 + length
+
+
+def splice_jpeg(data: bytes, exif: bytes, payloads: Sequence[bytes] = ()) -> bytes:
+    """Replace the EXIF segment and the payload segments of a JPEG, without
+    decoding the image. The new APP1 segments, EXIF then the given payload
+    chunks, follow the SOI marker or the JFIF APP0 segment.
+    """
+    if len(exif) + 2 > 0xFFFF:
+        raise ValueError("EXIF data too large for a JPEG segment.")
+    app1 = [
+        b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+        for payload in [exif, *payloads]
+    ]
+    segments, end = [], 2
+    for marker, start, end in jpeg_segments(data):
+        identifier = data[start + 4 : start + 12]
+        if marker == APP1 and (
+            identifier.startswith(EXIF_HEADER) or identifier == PAYLOAD_MAGIC
+        ):
+            continue
+        segments.append(data[start:end])
+    first = 1 if segments and segments[0][1] == APP0 else 0
+    return b"".join(
+        [JPEG_SOI] + segments[:first] + app1 + segments[first:] + [data[end:]]
+    )
+
+
+def tiff_tag(data: Buffer, tag: int, offset: int = 0) -> Optional[bytes]:
+    """Value of a BYTE, ASCII or UNDEFINED tag of the first IFD of the TIFF
+    data starting at offset, None if it is absent. Only this IFD is read.
+    """
+    order = "<" if data[offset : offset + 2] == b"II" else ">"
+    (ifd,) = struct.unpack_from(order + "I", data, offset + 4)
+    (count,) = struct.unpack_from(order + "H", data, offset + ifd)
+    for position in range(offset + ifd + 2, offset + ifd + 2 + 12 * count, 12):
+        entry_tag, entry_type, length = struct.unpack_from(order + "HHI", data, position)
+        if entry_tag != tag:
+            continue
+        if length <= 4:
+            value = data[position + 8 : position + 8 + length]
+        else:
+            (value_offset,) = struct.unpack_from(order + "I", data, position + 8)
+            value = data[offset + value_offset : offset + value_offset + length]
+        # Remove the NUL terminating ASCII strings
+        return value[:-1] if entry_type == 2 else value
+    return None
+
+
+def splice_tiff(data: bytes, tag: int, value: bytes) -> bytes:
+    """Set an ASCII tag of the first IFD of a TIFF, without decoding the image.
+    The value and a copy of the IFD are appended to the file, the header then
+    points to the new IFD.
+    """
+    order = "<" if data[:2] == b"II" else ">"
+    (offset,) = struct.unpack_from(order + "I", data, 4)
+    (count,) = struct.unpack_from(order + "H", data, offset)
+    entries = {}
+    for position in range(offset + 2, offset + 2 + 12 * count, 12):
+        (entry_tag,) = struct.unpack_from(order + "H", data, position)
+        entries[entry_tag] = data[position : position + 12]
+    next_ifd = data[offset + 2 + 12 * count : offset + 6 + 12 * count]
+
+    # Values are aligned on a word boundary
+    value += b"\x00"
+    padding = b"\x00" * (len(data) % 2)
+    if len(value) <= 4:
+        entries[tag] = struct.pack(order + "HHI", tag, 2, len(value)) + value.ljust(4, b"\x00")
+        value = b""
+    else:
+        entries[tag] = struct.pack(
+            order + "HHII", tag, 2, len(value), len(data) + len(padding)
+        )
+        value += b"\x00" * (len(value) % 2)
+    ifd = b"".join(
+        [struct.pack(order + "H", len(entries))]
+        + [entries[entry_tag] for entry_tag in sorted(entries)]
+        + [next_ifd]
+    )
+    new_offset = len(data) + len(padding) + len(value)
+    return b"".join(
+        [data[:4], struct.pack(order + "I", new_offset), data[8:], padding, value, ifd]
+    )
+
+
+def compress(
+    secret_message: Union[str, bytes, None] = None, secret_file: Optional[str] = None
+) -> bytes:
+    """Compress a message, or the content of a file, by blocks.
+    """
+    compressor = zlib.compressobj()
+    if secret_file is not None:
+        with open(secret_file, "rb") as f:
+            blocks = iter(lambda: f.read(BLOCK_SIZE), b"")
+            compressed = [compressor.compress(block) for block in blocks]
+    else:
+        if secret_message is None:
+            raise ValueError("No message or file to hide.")
+        if isinstance(secret_message, str):
+            secret_message = secret_message.encode("utf-8")
+        message = memoryview(secret_message)
+        compressed = [
+            compressor.compress(message[i : i + BLOCK_SIZE])
+            for i in range(0, len(message), BLOCK_SIZE)
+        ]
+    compressed.append(compressor.flush())
+    return b"".join(compressed)
+
+
+def chunks(compressed: bytes, size: int) -> List[bytes]:
+    """Split compressed data in chunks with their header.
+    """
+    parts = [compressed[i : i + size] for i in range(0, len(compressed), size)]
+    return [
+        PAYLOAD_HEADER.pack(PAYLOAD_MAGIC, index, len(parts), len(compressed)) + part
+        for index, part in enumerate(parts)
+    ]
+
+
+class Reassembler:
+    """Decompress the chunks of a payload as they are read.
+    """
+
+    def __init__(self):
+        self.decompressor = zlib.decompressobj()
+        self.parts = []  # type: List[bytes]
+        self.index = 0
+        self.count = None  # type: Optional[int]
+
+    def feed(self, chunk: bytes) -> None:
+        magic, index, count, _ = PAYLOAD_HEADER.unpack_from(chunk)
+        if magic != PAYLOAD_MAGIC or index != self.index:
+            raise ValueError("Missing part {} of the secret.".format(self.index))
+        self.count = count
+        self.parts.append(self.decompressor.decompress(chunk[PAYLOAD_HEADER.size :]))
+        self.index += 1
+
+    def result(self) -> bytes:
+        if self.index != self.count:
+            raise ValueError("Missing part {} of the secret.".format(self.index))
+        self.parts.append(self.decompressor.flush())
+        return b"".join(self.parts)
+
+
+def decode(description: bytes) -> bytes:
+    """Secret stored in an ImageDescription tag.
+    """
+    from base64 import b64decode
+
+    if description.startswith(PAYLOAD_MAGIC):
+        reassembler = Reassembler()
+        reassembler.feed(description)
+        return reassembler.result()
+    # Before the chunks, the base64 encoded secret was compressed
+    return b64decode(zlib.decompress(description))
+
+
+def _encoded_bytes(
+    input_image_file: Union[str, IO[bytes], Image.Image],
+    img: Image.Image,
+    img_format: str,
+) -> bytes:
+    """Content of an image file in the given format, the image is converted
+    only if the file is in another format or is an already opened Image.
+    """
+    data = _read_bytes(input_image_file) if img_format == img.format else None
+    if data is None:
+        # Convert the image, its EXIF data is then replaced
+        output = io.BytesIO()
+        exif = {"exif": img.info["exif"]} if "exif" in img.info else {}
+        img.save(output, format=img_format, **exif)
+        data = output.getvalue()
+    return data
+
 
 def hide(
     input_image_file, img_enc, secret_message=None, secret_file=None, img_format=None,
 ):
     """Hide a message (string) in an image.
-    """
-    from zlib import compress
-    from base64 import b64encode
 
-    if secret_file != None:
-        with open(secret_file, "r") as f:
-            secret_message = f.read()
-
-    try:
-        text = compress(b64encode(bytes(secret_message, "utf-8")))
-    except:
-        text = compress(b64encode(secret_message))
+    The EXIF data of JPEG and TIFF files is replaced in place: the image itself
+    is copied as is, without being decoded and encoded again. In JPEG files,
+    secrets larger than an EXIF segment are split in several APP1 segments.
+    """
+    compressed = compress(secret_message, secret_file)
+    # The whole secret in one chunk
+    (text,) = chunks(compressed, len(compressed))
 
     img = tools.open_image(input_image_file)
 
     if img_format is None:
         img_format = img.format
+    description = piexif.ImageIFD.ImageDescription
 
-    if "exif" in img.info:
-        exif_dict = piexif.load(img.info["exif"])
+    if img_format == "JPEG":
+        data = _encoded_bytes(input_image_file, img, img_format)
+        exif_dict = piexif.load(data)
+        exif_dict["0th"][description] = text
+        exif = piexif.dump(exif_dict)
+        if len(exif) + 2 <= 0xFFFF:
+            _write_bytes(img_enc, splice_jpeg(data, exif))
+        else:
+            del exif_dict["0th"][description]
+            exif = piexif.dump(exif_dict)
+            segments = chunks(compressed, CHUNK_SIZE)
+            _write_bytes(img_enc, splice_jpeg(data, exif, segments))
+    elif img_format == "TIFF":
+        data = _encoded_bytes(input_image_file, img, img_format)
+        _write_bytes(img_enc, splice_tiff(data, description, text))
     else:
-        exif_dict = {}
-        exif_dict["0th"] = {}
-    exif_dict["0th"][piexif.ImageIFD.ImageDescription] = text
-    exif_bytes = piexif.dump(exif_dict)
-    img.save(img_enc, format=img_format, exif=exif_bytes)
+        if "exif" in img.info:
+            exif_dict = piexif.load(img.info["exif"])
+        else:
+            exif_dict = {}
+            exif_dict["0th"] = {}
+        exif_dict["0th"][description] = text
+        exif_bytes = piexif.dump(exif_dict)
+        img.save(img_enc, format=img_format, exif=exif_bytes)
     img.close()
     return img
 
 
 def reveal(input_image_file):
     """Find a message in an image.
+
+    The file is not decoded: only the JPEG segments up to the secret, or the
+    first IFD of a TIFF file, are read.
     """
-    from base64 import b64decode
-    from zlib import decompress
+    description_key = piexif.ImageIFD.ImageDescription
 
-    img = tools.open_image(input_image_file)
+    if isinstance(input_image_file, Image.Image):
+        if input_image_file.format not in ["JPEG", "TIFF"]:
+            raise ValueError("Given file is neither JPEG nor TIFF.")
+        # Chunks of a large secret, in the APP1 segments kept by Pillow
+        reassembler = Reassembler()
+        for marker, segment in getattr(input_image_file, "applist", []):
+            if marker == "APP1" and segment.startswith(PAYLOAD_MAGIC):
+                reassembler.feed(segment)
+        if reassembler.index:
+            return reassembler.result()
+        exif = input_image_file.info.get("exif", b"")
+        if exif.startswith(EXIF_HEADER):
+            exif = exif[len(EXIF_HEADER) :]
+        return decode(exif and tiff_tag(exif, description_key) or b"")
 
-    try:
-        if img.format in ["JPEG", "TIFF"]:
-            if "exif" in img.info:
-                exif_dict = piexif.load(img.info.get("exif", b""))
-                description_key = piexif.ImageIFD.ImageDescription
-                encoded_message = exif_dict["0th"][description_key]
-            else:
-                encoded_message = b""
-        else:
+    with _map_bytes(input_image_file) as data:
+        if data[:4] in TIFF_HEADERS:
+            return decode(tiff_tag(data, description_key) or b"")
+        if data[:2] != JPEG_SOI:
             raise ValueError("Given file is neither JPEG nor TIFF.")
-    finally:
-        img.close()
 
-    return b64decode(decompress(encoded_message))
+        description = b""
+        reassembler = Reassembler()
+        for marker, start, end in jpeg_segments(data):
+            identifier = data[start + 4 : start + 12]
+            if marker == APP1 and identifier == PAYLOAD_MAGIC:
+                reassembler.feed(data[start + 4 : end])
+            elif reassembler.index:
+                # The chunks are consecutive
+                break
+            elif marker == APP1 and identifier.startswith(EXIF_HEADER):
+                description = tiff_tag(data, description_key, start + 10) or b""
+                if description:
+                    break
+    if reassembler.index:
+        return reassembler.result()
+    return decode(description)
 
 
 if __name__ == "__main__":
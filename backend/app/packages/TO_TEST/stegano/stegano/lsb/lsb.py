@@ -25,10 +25,45 @@ __date__ = "$Date: 2016/08/04 $"
 __revision__ = "$Date: 2019/06/01 $"
 __license__ = "GPLv3"
 
+import struct
+import zlib
 from typing import IO, Union
 
+import numpy as np
+from PIL import Image
+
 from stegano import tools
 
+# Binary framing: magic, version, flags, length of the payload in bytes and CRC32 of the payload
+HEADER = struct.Struct(">4sBBII")
+HEADER_MAGIC = b"STGN"
+HEADER_VERSION = 1
+FLAG_BYTES = 0x01  # The payload is returned as bytes
+FLAG_UTF32LE = 0x02  # The payload is a string encoded in UTF-32LE, UTF-8 otherwise
+
+
+def frame(message: Union[str, bytes], encoding: str = "UTF-8") -> bytes:
+    """Prefix a message with the binary header.
+    """
+    if isinstance(message, (bytes, bytearray, memoryview)):
+        payload, flags = bytes(message), FLAG_BYTES
+    elif encoding == "UTF-32LE":
+        payload, flags = message.encode("utf-32-le"), FLAG_UTF32LE
+    else:
+        payload, flags = message.encode("utf-8"), 0
+    header = HEADER.pack(
+        HEADER_MAGIC, HEADER_VERSION, flags, len(payload), zlib.crc32(payload)
+    )
+    return header + payload
+
+
+def read_bits(components: np.ndarray, nbits: int) -> np.ndarray:
+    """Return the first nbits LSB of an array of (r, g, b) components,
+    reading only the pixels holding them.
+    """
+    npixels = -(-nbits // 3)
+    return (components[:npixels] & 1).reshape(-1)[:nbits]
+
 
 def hide(
     input_image: Union[str, IO[bytes]],
@@ -36,9 +71,13 @@ def hide(
     encoding: str = "UTF-8",
     shift: int = 0,
     auto_convert_rgb: bool = False,
+    binary_header: bool = False,
 ):
     """Hide a message (string) in an image with the
     LSB (Least Significant Bit) technique.
+
+    With binary_header, the message (string or bytes) is prefixed by a binary
+    header (magic, version, length, CRC32) instead of its decimal length.
     """
     message_length = len(message)
     assert message_length != 0, "message length is zero"
@@ -53,48 +92,38 @@ def hide(
                 raise Exception("Not a RGB image.")
         img = img.convert("RGB")
 
-    encoded = img.copy()
     width, height = img.size
-    index = 0
 
-    message = str(message_length) + ":" + str(message)
-    message_bits = "".join(tools.a2bits_list(message, encoding))
-    message_bits += "0" * ((3 - (len(message_bits) % 3)) % 3)
+    if binary_header:
+        message_bits = np.unpackbits(
+            np.frombuffer(frame(message, encoding), dtype=np.uint8)
+        )
+    else:
+        message = str(message_length) + ":" + str(message)
+        message_bits = tools.a2bits_array(message, encoding)
+    message_bits = np.append(
+        message_bits, np.zeros((3 - (len(message_bits) % 3)) % 3, dtype=np.uint8)
+    )
 
     npixels = width * height
     len_message_bits = len(message_bits)
-    if len_message_bits > npixels * 3:
+    if len_message_bits > npixels * 3 or shift + len_message_bits // 3 > npixels:
         raise Exception(
             "The message you want to hide is too long: {}".format(message_length)
         )
-    for row in range(height):
-        for col in range(width):
-            if shift != 0:
-                shift -= 1
-                continue
-            if index + 3 <= len_message_bits:
-
-                # Get the colour component.
-                pixel = img.getpixel((col, row))
-                r = pixel[0]
-                g = pixel[1]
-                b = pixel[2]
-
-                # Change the Least Significant Bit of each colour component.
-                r = tools.setlsb(r, message_bits[index])
-                g = tools.setlsb(g, message_bits[index + 1])
-                b = tools.setlsb(b, message_bits[index + 2])
-
-                # Save the new pixel
-                if img.mode == "RGBA":
-                    encoded.putpixel((col, row), (r, g, b, pixel[3]))
-                else:
-                    encoded.putpixel((col, row), (r, g, b))
-
-                index += 3
-            else:
-                img.close()
-                return encoded
+
+    # The pixels are taken row by row, after the first shift ones
+    pixels = np.array(img)
+    components = pixels.reshape(npixels, -1)[shift : shift + len_message_bits // 3, :3]
+
+    # Change the Least Significant Bit of each colour component.
+    components &= 0xFE
+    components |= message_bits.reshape(-1, 3)
+
+    encoded = Image.fromarray(pixels, img.mode)
+    encoded.info = img.info.copy()
+    img.close()
+    return encoded
 
 
 def reveal(input_image: Union[str, IO[bytes]], encoding: str = "UTF-8", shift: int = 0):
@@ -102,30 +131,53 @@ def reveal(input_image: Union[str, IO[bytes]], encoding: str = "UTF-8", shift: i
     """
     img = tools.open_image(input_image)
     width, height = img.size
-    buff, count = 0, 0
-    bitab = []
-    limit = None
-    for row in range(height):
-        for col in range(width):
-            if shift != 0:
-                shift -= 1
-                continue
-            # pixel = [r, g, b] or [r,g,b,a]
-            pixel = img.getpixel((col, row))
-            if img.mode == "RGBA":
-                pixel = pixel[:3]  # ignore the alpha
-            for color in pixel:
-                buff += (color & 1) << (tools.ENCODINGS[encoding] - 1 - count)
-                count += 1
-                if count == tools.ENCODINGS[encoding]:
-                    bitab.append(chr(buff))
-                    buff, count = 0, 0
-                    if bitab[-1] == ":" and limit is None:
-                        try:
-                            limit = int("".join(bitab[:-1]))
-                        except Exception:
-                            pass
-
-            if len(bitab) - len(str(limit)) - 1 == limit:
-                img.close()
-                return "".join(bitab)[len(str(limit)) + 1:]
+    char_bits = tools.ENCODINGS[encoding]
+    # pixel = [r, g, b] or [r,g,b,a], ignore the alpha
+    pixels = np.asarray(img)
+    img.close()
+    components = pixels.reshape(width * height, -1)[shift:, :3]
+
+    # Binary header, checked with the first few pixels
+    if len(components) * 3 >= HEADER.size * 8:
+        header = np.packbits(read_bits(components, HEADER.size * 8)).tobytes()
+        magic, version, flags, length, crc = HEADER.unpack(header)
+        if magic == HEADER_MAGIC:
+            return _reveal_framed(components, version, flags, length, crc)
+
+    def read(nchars):
+        # Pixels holding the first nchars characters
+        return tools.bits2codes(read_bits(components, nchars * char_bits), encoding)
+
+    # The message is prefixed by its length in decimal, which cannot be longer than
+    # the number of characters the image can hold
+    max_length = len(components) * 3 // char_bits
+    header = read(min(len(str(max_length)) + 1, max_length))
+    colons = np.flatnonzero(header == ord(":"))
+    if len(colons) == 0:
+        return None
+    try:
+        limit = int(tools.codes2a(header[: colons[0]]))
+    except Exception:
+        return None
+    nchars = len(str(limit)) + 1 + limit
+    if limit < 0 or nchars > max_length:
+        return None
+    return tools.codes2a(read(nchars))[len(str(limit)) + 1 :]
+
+
+def _reveal_framed(
+    components: np.ndarray, version: int, flags: int, length: int, crc: int
+) -> Union[str, bytes]:
+    """Extract the payload following a binary header.
+    """
+    if version != HEADER_VERSION:
+        raise ValueError("Unsupported header version: {}".format(version))
+    nbits = (HEADER.size + length) * 8
+    if nbits > len(components) * 3:
+        raise ValueError("Impossible to detect message.")
+    payload = np.packbits(read_bits(components, nbits)[HEADER.size * 8 :]).tobytes()
+    if zlib.crc32(payload) != crc:
+        raise ValueError("CRC mismatch: the message is corrupted.")
+    if flags & FLAG_BYTES:
+        return payload
+    return payload.decode("utf-32-le" if flags & FLAG_UTF32LE else "utf-8")
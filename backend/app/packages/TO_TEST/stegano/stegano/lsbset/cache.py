@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Stegano - Stegano is a pure Python steganography module.
+#
+# For more information : https://git.sr.ht/~cedric/stegano
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+"""Cache of the tables of pixel indices used by lsbset.
+
+A table holds the indices produced by a generator for an image size, after
+the shift. Tables are kept in memory with a LRU eviction and, if a directory
+is given, saved as .npy files which are memory-mapped when loaded.
+"""
+
+__license__ = "GPLv3"
+
+import collections
+import inspect
+import os
+import tempfile
+import threading
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from . import generators
+
+CACHE_SIZE = 128
+
+Key = Tuple[str, tuple, Tuple[int, int], int]
+
+
+def describe(generator: Iterator[int]) -> Optional[Tuple[str, tuple]]:
+    """Name and arguments of a generator of stegano.lsbset.generators which
+    has not been started yet, None for any other iterator.
+    """
+    name = getattr(generator, "__name__", "")
+    function = getattr(generators, name, None)
+    if (
+        name not in generators.TAKE
+        or getattr(generator, "gi_code", None) is not function.__code__
+        or inspect.getgeneratorstate(generator) != inspect.GEN_CREATED
+    ):
+        return None
+    arguments = inspect.getgeneratorlocals(generator)
+    return (
+        function.__name__,
+        tuple(arguments[name] for name in inspect.signature(function).parameters),
+    )
+
+
+class IndexCache:
+    """LRU cache of index tables, optionally persisted in a directory.
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE, directory: Optional[str] = None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self._tables = collections.OrderedDict()  # type: collections.OrderedDict
+        self._lock = threading.Lock()
+
+    def path(self, key: Key) -> str:
+        """Location of the .npy file of a table.
+        """
+        name, args, (width, height), shift = key
+        parts = [name] + [str(arg) for arg in args] + [
+            "{}x{}".format(width, height),
+            str(shift),
+        ]
+        return os.path.join(self.directory, "-".join(parts) + ".npy")
+
+    def get(
+        self, name: str, args: tuple, size: Tuple[int, int], shift: int, n: int
+    ) -> np.ndarray:
+        """The first n indices of the generator name(*args) for an image of the
+        given size, after shift values. Less than n indices are returned if
+        the sequence reaches the number of pixels first.
+        """
+        key = (name, tuple(args), tuple(size), shift)
+        with self._lock:
+            table, complete = self._tables.get(key, (None, False))
+            if table is not None:
+                self._tables.move_to_end(key)
+        if table is None and self.directory is not None:
+            try:
+                table = np.load(self.path(key), mmap_mode="r")
+            except (OSError, ValueError):
+                table = None
+        if table is not None and (complete or len(table) >= n):
+            self._store(key, table, complete)
+            return table[:n]
+
+        # Grow the tables geometrically, in order to reveal in several steps
+        count = max(n, 2 * len(table)) if table is not None else n
+        width, height = size
+        take = generators.TAKE[name]
+        table = take(shift + count, width * height, *args)[shift:]
+        complete = len(table) < count
+        if self.directory is not None:
+            self._save(key, table)
+        self._store(key, table, complete)
+        return table[:n]
+
+    def _save(self, key: Key, table: np.ndarray) -> None:
+        # Replace the file atomically, an older version may still be mapped
+        fd, tmp = tempfile.mkstemp(suffix=".npy", dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, table)
+        os.replace(tmp, self.path(key))
+
+    def _store(self, key: Key, table: np.ndarray, complete: bool) -> None:
+        with self._lock:
+            self._tables[key] = (table, complete)
+            self._tables.move_to_end(key)
+            while len(self._tables) > self.maxsize:
+                self._tables.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove the tables from the memory.
+        """
+        with self._lock:
+            self._tables.clear()
+
+
+index_cache = IndexCache()
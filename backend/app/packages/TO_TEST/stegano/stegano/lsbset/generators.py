@@ -25,9 +25,13 @@ __date__ = "$Date: 2011/12/28 $"
 __revision__ = "$Date: 2019/06/04 $"
 __license__ = "GPLv3"
 
-import itertools
+import functools
 import math
-from typing import Dict, Iterator, List
+from typing import Callable, Dict, Iterator, Optional
+
+import numpy as np
+
+from . import sequences
 
 
 def identity() -> Iterator[int]:
@@ -68,43 +72,36 @@ def mersenne() -> Iterator[int]:
         yield 2 ** next(prime_numbers) - 1
 
 
-def eratosthenes() -> Iterator[int]:
-    """Generate the prime numbers with the sieve of Eratosthenes.
+def eratosthenes(bound: Optional[int] = None) -> Iterator[int]:
+    """Generate the prime numbers below bound (all of them by default) with a
+    segmented sieve of Eratosthenes.
     https://oeis.org/A000040
     """
-    d = {}  # type: Dict[int, List[int]]
-    for i in itertools.count(2):
-        if i in d:
-            for j in d[i]:
-                d[i + j] = d.get(i + j, []) + [j]
-            del d[i]
-        else:
-            d[i * i] = [i]
-            yield i
+    for primes in sequences.segmented_sieve(bound):
+        yield from primes.tolist()
 
 
-def composite() -> Iterator[int]:
-    """Generate the composite numbers using the sieve of Eratosthenes.
+def composite(bound: Optional[int] = None) -> Iterator[int]:
+    """Generate the composite numbers below bound (all of them by default)
+    using the sieve of Eratosthenes.
     https://oeis.org/A002808
     """
     p1 = 3
-    for p2 in eratosthenes():
-        for n in range(p1 + 1, p2):
-            yield n
+    for p2 in eratosthenes(bound):
+        yield from range(p1 + 1, p2)
         p1 = p2
+    if bound is not None:
+        yield from range(p1 + 1, bound)
 
 
-def carmichael() -> Iterator[int]:
+def carmichael(bound: Optional[int] = None) -> Iterator[int]:
     """Composite numbers n such that a^(n-1) == 1 (mod n) for every a coprime
-    to n.
+    to n, below bound (all of them by default). They are found with the
+    Korselt's criterion.
     https://oeis.org/A002997
     """
-    for m in composite():
-        for a in range(2, m):
-            if pow(a, m, m) != a:
-                break
-        else:
-            yield m
+    for numbers in sequences.carmichael_blocks(bound):
+        yield from numbers.tolist()
 
 
 def ackermann_slow(m: int, n: int) -> int:
@@ -214,20 +211,36 @@ def LFSR(m: int) -> Iterator[int]:
     https://en.wikipedia.org/wiki/Linear-feedback_shift_register
     """
     n: int = m.bit_length() - 1
-    # Set initial state to {1 0 0 ... 0}
-    state: List[int] = [0] * n
-    state[0] = 1
-    feedback: int = 0
-    poly: List[int] = polys[n]
-    while True:
-        # Compute the feedback bit
-        feedback = 0
-        for i in range(len(poly)):
-            feedback = feedback ^ state[poly[i] - 1]
-        # Roll the registers
-        state.pop()
-        # Add the feedback bit
-        state.insert(0, feedback)
-        # Convert the registers to an int
-        out = sum([e * (2 ** i) for i, e in enumerate(state)])
-        yield out
+    # Initial state is {1 0 0 ... 0}, bit i of the output is the register i
+    step = sequences.fibonacci_step(polys[n])
+    for block in sequences.lfsr_blocks(step, n):
+        yield from block.tolist()
+
+
+def LFSR_galois(m: int) -> Iterator[int]:
+    """LFSR generator of the given size, in Galois form
+    https://en.wikipedia.org/wiki/Linear-feedback_shift_register#Galois_LFSRs
+    """
+    n: int = m.bit_length() - 1
+    step = sequences.galois_step(polys[n])
+    for block in sequences.lfsr_blocks(step, n):
+        yield from block.tolist()
+
+
+# Bulk versions of the generators, by name: TAKE[name](n, limit, *args)
+# returns the first n values below limit as a NumPy array.
+TAKE: Dict[str, Callable[..., np.ndarray]] = {
+    "identity": sequences.identity,
+    "triangular_numbers": sequences.triangular_numbers,
+    "eratosthenes": sequences.eratosthenes,
+    "composite": sequences.composite,
+    "carmichael": sequences.carmichael,
+    "LFSR": lambda n, limit, m: sequences.lfsr(n, limit, polys[m.bit_length() - 1]),
+    "LFSR_galois": lambda n, limit, m: sequences.lfsr(
+        n, limit, polys[m.bit_length() - 1], galois=True
+    ),
+}
+TAKE.update(
+    (generator.__name__, functools.partial(sequences.take, generator))
+    for generator in (fermat, mersenne, ackermann_naive, ackermann, fibonacci, log_gen)
+)
@@ -25,12 +25,47 @@ __date__ = "$Date: 2016/03/13 $"
 __revision__ = "$Date: 2019/05/31 $"
 __license__ = "GPLv3"
 
-from typing import IO, Iterator, Union
+import itertools
+from typing import IO, Iterator, Tuple, Union
 
+import numpy as np
 from PIL import Image
 
 from stegano import tools
 
+from . import cache
+
+
+class Indices:
+    """Pixel indices given by a generator after a shift. They come from the
+    index cache for the generators of stegano.lsbset.generators, otherwise the
+    generator is consumed.
+    """
+
+    def __init__(self, generator: Iterator[int], shift: int, size: Tuple[int, int]):
+        self.generator = generator
+        self.shift = shift
+        self.size = size
+        self.description = cache.describe(generator)
+        self.table: np.ndarray = np.empty(0, dtype=np.int64)
+
+    def first(self, n: int) -> np.ndarray:
+        """The n first indices, or less if the image is too small.
+        """
+        if self.description is not None:
+            name, args = self.description
+            return cache.index_cache.get(name, args, self.size, self.shift, n)
+        if len(self.table) < n:
+            if self.shift:
+                next(itertools.islice(self.generator, self.shift - 1, None), None)
+                self.shift = 0
+            values = itertools.islice(self.generator, n - len(self.table))
+            table = np.fromiter(values, dtype=np.int64)
+            self.table = np.concatenate([self.table, table])
+        npixels = self.size[0] * self.size[1]
+        outside = np.flatnonzero((self.table[:n] < 0) | (self.table[:n] >= npixels))
+        return self.table[: outside[0] if len(outside) else n]
+
 
 def hide(
     input_image: Union[str, IO[bytes]],
@@ -56,48 +91,31 @@ def hide(
                 raise Exception("Not a RGB image.")
         img = img.convert("RGB")
 
-    img_list = list(img.getdata())
     width, height = img.size
-    index = 0
+    npixels = width * height
 
     message = str(message_length) + ":" + str(message)
-    message_bits = "".join(tools.a2bits_list(message, encoding))
-    message_bits += "0" * ((3 - (len(message_bits) % 3)) % 3)
+    message_bits = tools.a2bits_array(message, encoding)
+    message_bits = np.append(message_bits, np.zeros(-len(message_bits) % 3, np.uint8))
 
-    npixels = width * height
     len_message_bits = len(message_bits)
     if len_message_bits > npixels * 3:
         raise Exception(
             "The message you want to hide is too long: {}".format(message_length)
         )
-    while shift != 0:
-        next(generator)
-        shift -= 1
-
-    while index + 3 <= len_message_bits:
-        generated_number = next(generator)
-        r, g, b, *a = img_list[generated_number]
-
-        # Change the Least Significant Bit of each colour component.
-        r = tools.setlsb(r, message_bits[index])
-        g = tools.setlsb(g, message_bits[index + 1])
-        b = tools.setlsb(b, message_bits[index + 2])
-
-        # Save the new pixel
-        if img.mode == "RGBA":
-            img_list[generated_number] = (r, g, b, *a)
-        else:
-            img_list[generated_number] = (r, g, b)
-
-        index += 3
-
-    # create empty new image of appropriate format
-    encoded = Image.new(img.mode, (img.size))
+    indices = Indices(generator, shift, img.size).first(len_message_bits // 3)
+    if len(indices) < len_message_bits // 3:
+        raise IndexError("The generator goes beyond the image.")
 
-    # insert saved data into the image
-    encoded.putdata(img_list)
+    # Change the Least Significant Bit of each colour component of the
+    # selected pixels only, the alpha channel is kept.
+    pixels = np.array(img).reshape(npixels, -1)
+    components = pixels[indices, :3]
+    components &= 0xFE
+    components |= message_bits.reshape(-1, 3)
+    pixels[indices, :3] = components
 
-    return encoded
+    return Image.fromarray(pixels.reshape(height, width, -1), img.mode)
 
 
 def reveal(
@@ -109,29 +127,27 @@ def reveal(
     """Find a message in an image (with the LSB technique).
     """
     img = tools.open_image(input_image)
-    img_list = list(img.getdata())
     width, height = img.size
-    buff, count = 0, 0
-    bitab = []
-    limit = None
-
-    while shift != 0:
-        next(generator)
-        shift -= 1
-
-    while True:
-        generated_number = next(generator)
-        # color = [r, g, b]
-        for color in img_list[generated_number][:3]:  # ignore the alpha
-            buff += (color & 1) << (tools.ENCODINGS[encoding] - 1 - count)
-            count += 1
-            if count == tools.ENCODINGS[encoding]:
-                bitab.append(chr(buff))
-                buff, count = 0, 0
-                if bitab[-1] == ":" and limit == None:
-                    if "".join(bitab[:-1]).isdigit():
-                        limit = int("".join(bitab[:-1]))
-                    else:
-                        raise IndexError("Impossible to detect message.")
-        if len(bitab) - len(str(limit)) - 1 == limit:
-            return "".join(bitab)[len(str(limit)) + 1 :]
+    pixels = np.asarray(img).reshape(width * height, -1)
+    width_bits = tools.ENCODINGS[encoding]
+    indices = Indices(generator, shift, img.size)
+
+    def read(nchars: int) -> str:
+        # Three bits per pixel, one per colour component (ignore the alpha).
+        # Less characters are returned if the generator goes beyond the image.
+        table = indices.first(-(-nchars * width_bits // 3))
+        bits = pixels[table, :3].reshape(-1) & 1
+        codes = tools.bits2codes(bits, encoding)
+        return tools.codes2a(codes[:nchars])
+
+    # The length of the message, followed by ":"
+    max_digits = len(str(width * height * 3 // width_bits))
+    prefix = read(max_digits + 1)
+    limit = prefix.find(":")
+    if limit <= 0 or not prefix[:limit].isdigit():
+        raise IndexError("Impossible to detect message.")
+    message_length = int(prefix[:limit])
+    message = read(limit + 1 + message_length)[limit + 1 :]
+    if len(message) < message_length:
+        raise IndexError("Impossible to detect message.")
+    return message
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Stegano - Stegano is a pure Python steganography module.
+#
+# For more information : https://git.sr.ht/~cedric/stegano
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+
+"""Bulk versions of the generators.
+
+Each function returns, as a NumPy int64 array, the first n values of the
+corresponding generator, stopping before the first value which is not below
+limit. They are registered in generators.TAKE.
+"""
+
+__license__ = "GPLv3"
+
+import itertools
+import math
+from typing import Callable, Iterator, List, Optional
+
+import numpy as np
+
+# Size of the first segment of the sieves, in integers
+SEGMENT_SIZE = 2 ** 16
+
+# Number of LFSR states computed one by one, then by blocks up to this size
+LFSR_FIRST_BLOCK = 2 ** 8
+LFSR_BLOCK_SIZE = 2 ** 16
+
+
+def take(
+    generator: Callable[..., Iterator[int]], n: int, limit: int, *args: int
+) -> np.ndarray:
+    """Consume a generator, for the sequences without a bulk version.
+    """
+    values = itertools.takewhile(
+        lambda value: value < limit, itertools.islice(generator(*args), n)
+    )
+    return np.fromiter(values, dtype=np.int64)
+
+
+def identity(n: int, limit: int) -> np.ndarray:
+    """0, 1, 2, ...
+    """
+    return np.arange(min(n, max(limit, 0)), dtype=np.int64)
+
+
+def triangular_numbers(n: int, limit: int) -> np.ndarray:
+    """k(k+1)/2 for k = 0, 1, 2, ...
+    """
+    # Number of triangular numbers below limit, plus one for rounding
+    count = (math.isqrt(8 * max(limit, 0) + 1) + 1) // 2 + 1
+    k = np.arange(min(n, count), dtype=np.int64)
+    numbers = k * (k + 1) // 2
+    return numbers[numbers < limit]
+
+
+def sieve(limit: int) -> np.ndarray:
+    """Boolean array telling which integers below limit are prime.
+    """
+    is_prime = np.ones(max(limit, 2), dtype=bool)
+    is_prime[:2] = False
+    for i in range(2, math.isqrt(max(limit - 1, 0)) + 1):
+        if is_prime[i]:
+            is_prime[i * i :: i] = False
+    return is_prime[: max(limit, 0)]
+
+
+def prime_bound(n: int) -> int:
+    """An integer above the n-th prime number.
+    """
+    if n < 6:
+        return 14
+    # Rosser's theorem: p(n) < n (ln n + ln ln n) for n >= 6
+    return int(n * (math.log(n) + math.log(math.log(n)))) + 1
+
+
+def segmented_sieve(
+    bound: Optional[int] = None, segment_size: int = SEGMENT_SIZE
+) -> Iterator[np.ndarray]:
+    """Yield the prime numbers below bound (all of them if bound is None),
+    segment after segment.
+    """
+    low = 0
+    while bound is None or low < bound:
+        high = low + segment_size if bound is None else min(low + segment_size, bound)
+        if low == 0:
+            is_prime = sieve(high)
+        else:
+            is_prime = np.ones(high - low, dtype=bool)
+            for p in np.flatnonzero(sieve(math.isqrt(high - 1) + 1)).tolist():
+                start = max(p * p, -(-low // p) * p)
+                is_prime[start - low :: p] = False
+        yield np.flatnonzero(is_prime).astype(np.int64) + low
+        low = high
+
+
+def smallest_prime_factors(limit: int) -> np.ndarray:
+    """Smallest prime factor of the integers below limit (n itself for 0, 1
+    and the prime numbers).
+    """
+    dtype = np.int32 if limit < 2 ** 31 else np.int64
+    spf = np.zeros(max(limit, 2), dtype=dtype)
+    for p in np.flatnonzero(sieve(math.isqrt(max(limit - 1, 0)) + 1)).tolist():
+        multiples = spf[p * p :: p]
+        multiples[multiples == 0] = p
+    unset = np.flatnonzero(spf == 0)
+    spf[unset] = unset
+    return spf[: max(limit, 0)]
+
+
+def korselt(numbers: np.ndarray, spf: np.ndarray) -> np.ndarray:
+    """Mask of the Carmichael numbers: composite, square-free and such that
+    p - 1 divides n - 1 for each prime factor p of n.
+    """
+    numbers = numbers.astype(np.int64)
+    is_carmichael = (numbers > 2) & (spf[numbers] != numbers)
+    rest = numbers.copy()
+    while True:
+        active = np.flatnonzero(is_carmichael & (rest > 1))
+        if not len(active):
+            return is_carmichael
+        p = spf[rest[active]].astype(np.int64)
+        quotient = rest[active] // p
+        is_carmichael[active] = ((numbers[active] - 1) % (p - 1) == 0) & (
+            quotient % p != 0
+        )
+        rest[active] = quotient
+
+
+def carmichael_blocks(
+    bound: Optional[int] = None, segment_size: int = SEGMENT_SIZE
+) -> Iterator[np.ndarray]:
+    """Yield the Carmichael numbers below bound (all of them if bound is
+    None), in blocks of doubling size.
+    """
+    low, high = 0, segment_size
+    while bound is None or low < bound:
+        if bound is not None:
+            high = min(high, bound)
+        # Carmichael numbers are odd
+        numbers = np.arange(low | 1, high, 2, dtype=np.int64)
+        yield numbers[korselt(numbers, smallest_prime_factors(high))]
+        low, high = high, 2 * high
+
+
+def eratosthenes(n: int, limit: int, bound: Optional[int] = None) -> np.ndarray:
+    """Prime numbers.
+    """
+    if bound is not None:
+        limit = min(limit, bound)
+    is_prime = sieve(min(limit, prime_bound(n)))
+    return np.flatnonzero(is_prime)[:n].astype(np.int64)
+
+
+def composite(n: int, limit: int, bound: Optional[int] = None) -> np.ndarray:
+    """Composite numbers.
+    """
+    if bound is not None:
+        limit = min(limit, bound)
+    # There are n + 1 even numbers in [4, 2n + 4]
+    is_prime = sieve(min(limit, 2 * n + 5))
+    return np.flatnonzero(~is_prime)[2 : n + 2].astype(np.int64)
+
+
+def carmichael(n: int, limit: int, bound: Optional[int] = None) -> np.ndarray:
+    """Carmichael numbers.
+    """
+    if bound is not None:
+        limit = min(limit, bound)
+    blocks, count = [], 0
+    for block in carmichael_blocks(limit):
+        blocks.append(block)
+        count += len(block)
+        if count >= n:
+            break
+    return np.concatenate(blocks or [np.empty(0, dtype=np.int64)])[:n]
+
+
+def fibonacci_step(poly: List[int]) -> Callable[[int], int]:
+    """One step of the Fibonacci LFSR with the given taps: the register is
+    shifted left and the parity of the tapped bits enters as bit 0.
+    """
+    mask = (1 << poly[0]) - 1
+    taps = sum(1 << (tap - 1) for tap in poly)
+    return lambda state: ((state << 1) & mask) | (bin(state & taps).count("1") & 1)
+
+
+def galois_step(poly: List[int]) -> Callable[[int], int]:
+    """One step of the Galois LFSR with the given taps: the register is
+    shifted right and, if the output bit was set, xored with the taps.
+    """
+    taps = sum(1 << (tap - 1) for tap in poly)
+    return lambda state: (state >> 1) ^ (taps if state & 1 else 0)
+
+
+def _transform(columns: List[int], state: int) -> int:
+    # Image of a state by the linear map given by the images of the bits
+    result = 0
+    for column in columns:
+        if state & 1:
+            result ^= column
+        state >>= 1
+    return result
+
+
+def _byte_tables(columns: List[int]) -> List[np.ndarray]:
+    # For each byte of the state, the image of its 256 values
+    values = np.arange(256, dtype=np.int64)
+    tables = []
+    for low in range(0, len(columns), 8):
+        table = np.zeros(256, dtype=np.int64)
+        for bit, column in enumerate(columns[low : low + 8]):
+            table ^= np.where((values >> bit) & 1, column, 0)
+        tables.append(table)
+    return tables
+
+
+def lfsr_blocks(
+    step: Callable[[int], int], width: int, block_size: int = LFSR_BLOCK_SIZE
+) -> Iterator[np.ndarray]:
+    """Yield the successive states of a LFSR of the given width, from the
+    state 1, in blocks of increasing size up to block_size.
+
+    The step is a linear map over the bits of the state, so the states of a
+    block are obtained at once from the states of the previous one with the
+    map applied len(block) times, through one lookup table per byte.
+    """
+    block = np.empty(LFSR_FIRST_BLOCK, dtype=np.int64)
+    state = 1
+    for i in range(len(block)):
+        state = step(state)
+        block[i] = state
+    yield block
+
+    # Images of the bits by the step applied len(block) times
+    columns = [step(1 << bit) for bit in range(width)]
+    for _ in range(len(block).bit_length() - 1):
+        columns = [_transform(columns, column) for column in columns]
+    while True:
+        tables = _byte_tables(columns)
+        following = tables[0][block & 0xFF]
+        for byte, table in enumerate(tables[1:], 1):
+            following ^= table[(block >> (8 * byte)) & 0xFF]
+        yield following
+        if len(block) < block_size:
+            block = np.concatenate([block, following])
+            columns = [_transform(columns, column) for column in columns]
+        else:
+            block = following
+
+
+def lfsr(n: int, limit: int, poly: List[int], galois: bool = False) -> np.ndarray:
+    """Outputs of the Fibonacci (or Galois) LFSR with the given taps, from the
+    state 1.
+    """
+    step = galois_step(poly) if galois else fibonacci_step(poly)
+    blocks, count = [], 0
+    for block in lfsr_blocks(step, poly[0]):
+        blocks.append(block)
+        count += len(block)
+        if count >= n:
+            break
+    values = np.concatenate(blocks)[:n]
+    outside = np.flatnonzero(values >= limit)
+    return values[: outside[0]] if len(outside) else values
@@ -25,10 +25,21 @@ __date__ = "$Date: 2010/10/01 $"
 __revision__ = "$Date: 2017/02/06 $"
 __license__ = "GPLv3"
 
+import struct
 from typing import IO, Union
 
+import numpy as np
+from PIL import Image
+
 from stegano import tools
 
+# Modes of which the first channel is used, the others are converted to RGB
+MODES = ["L", "LA", "RGB", "RGBA"]
+
+# Value of the first red sample announcing a 32 bits length in the next four
+EXTENDED_LENGTH = 255
+LENGTH = struct.Struct(">I")
+
 
 def hide(input_image: Union[str, IO[bytes]], message: str):
     """
@@ -36,29 +47,30 @@ def hide(input_image: Union[str, IO[bytes]], message: str):
 
     Use the red portion of a pixel (r, g, b) tuple to
     hide the message string characters as ASCII values.
-    The red value of the first pixel is used for message_length of the string.
+    The red value of the first pixel is used for message_length of the string,
+    or is 255 and followed by the length on the red values of 4 pixels for
+    messages of 255 characters and more.
     """
     message_length = len(message)
     assert message_length != 0, "message message_length is zero"
-    assert message_length < 255, "message is too long"
     img = tools.open_image(input_image)
-    # Use a copy of image to hide the text in
-    encoded = img.copy()
+    if img.mode not in MODES:
+        img = img.convert("RGB")
     width, height = img.size
-    index = 0
-    for row in range(height):
-        for col in range(width):
-            (r, g, b) = img.getpixel((col, row))
-            # first value is message_length of message
-            if row == 0 and col == 0 and index < message_length:
-                asc = message_length
-            elif index <= message_length:
-                c = message[index - 1]
-                asc = ord(c)
-            else:
-                asc = r
-            encoded.putpixel((col, row), (asc, g, b))
-            index += 1
+
+    if message_length < EXTENDED_LENGTH:
+        header = bytes([message_length])
+    else:
+        header = bytes([EXTENDED_LENGTH]) + LENGTH.pack(message_length)
+    data = np.frombuffer(header + message.encode("latin-1"), dtype=np.uint8)
+    assert len(data) <= width * height, "message is too long"
+
+    # Use a copy of image to hide the text in, only the rows of the first red
+    # values are rewritten
+    encoded = img.copy()
+    rows = np.array(img.crop((0, 0, width, -(-len(data) // width))))
+    rows.reshape(rows.shape[0] * width, -1)[: len(data), 0] = data
+    encoded.paste(Image.fromarray(rows, img.mode), (0, 0))
     img.close()
     return encoded
 
@@ -72,17 +84,23 @@ def reveal(input_image: Union[str, IO[bytes]]):
     The red value of the first pixel is used for message_length of string.
     """
     img = tools.open_image(input_image)
+    if img.mode not in MODES:
+        img = img.convert("RGB")
     width, height = img.size
-    message = ""
-    index = 0
-    for row in range(height):
-        for col in range(width):
-            r, g, b = img.getpixel((col, row))
-            # First pixel r value is length of message
-            if row == 0 and col == 0:
-                message_length = r
-            elif index <= message_length:
-                message += chr(r)
-            index += 1
+
+    def red(start: int, stop: int) -> np.ndarray:
+        # Red values of the pixels start to stop, only their rows are read
+        stop = min(stop, width * height)
+        if stop <= start:
+            return np.empty(0, dtype=np.uint8)
+        top, bottom = start // width, -(-stop // width)
+        rows = np.asarray(img.crop((0, top, width, bottom)).getchannel(0))
+        return rows.reshape(-1)[start - top * width : stop - top * width]
+
+    message_length, offset = int(red(0, 1)[0]), 1
+    if message_length == EXTENDED_LENGTH:
+        (message_length,) = LENGTH.unpack(red(1, 5).tobytes())
+        offset = 5
+    message = red(offset, offset + message_length).tobytes().decode("latin-1")
     img.close()
     return message
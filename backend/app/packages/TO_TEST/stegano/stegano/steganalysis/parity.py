@@ -25,29 +25,67 @@ __date__ = "$Date: 2010/10/01 $"
 __revision__ = "$Date: 2019/06/06 $"
 __license__ = "GPLv3"
 
+from typing import List, Optional, Union
+
+import numpy as np
 from PIL import Image
 
+# Rows of the image processed at once by steganalyse
+TILE_ROWS = 1024
+
+
+# Modes analysed as they are, the others are converted to RGB
+MODES = ["L", "LA", "RGB", "RGBA"]
+
+
+def parity_map(
+    pixels: np.ndarray, alpha: bool = False, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Least significant bit of the colour components as 0 or 255. If alpha is
+    True, the last axis holds the channels and the last one, the alpha
+    channel, is set to 255. Works the same on a stack of images. The map is
+    written in out if given.
+    """
+    analysis = np.bitwise_and(pixels, 1, out=out, dtype=np.uint8)
+    analysis *= np.uint8(255)
+    if alpha:
+        analysis[..., -1] = 255
+    return analysis
+
 
-def steganalyse(img: Image.Image) -> Image.Image:
+def steganalyse(
+    img: Image.Image, as_array: bool = False, tile_rows: Optional[int] = TILE_ROWS
+) -> Union[Image.Image, np.ndarray]:
     """
     Steganlysis of the LSB technique.
+
+    The image is read by tiles of tile_rows rows (all at once if None). The
+    parity map is returned as an image of the same mode, or as an array.
     """
-    encoded = Image.new(img.mode, (img.size))
+    if img.mode not in MODES:
+        img = img.convert("RGB")
     width, height = img.size
-    for row in range(height):
-        for col in range(width):
-            r, g, b = img.getpixel((col, row))[0:3]
-            if r % 2 == 0:
-                r = 0
-            else:
-                r = 255
-            if g % 2 == 0:
-                g = 0
-            else:
-                g = 255
-            if b % 2 == 0:
-                b = 0
-            else:
-                b = 255
-            encoded.putpixel((col, row), (r, g, b))
-    return encoded
+    tile_rows = tile_rows or height
+    bands = len(img.getbands())
+    analysis = np.empty((height, width) + ((bands,) if bands > 1 else ()), np.uint8)
+    # Only one tile of the image is decoded at once
+    for top in range(0, height, tile_rows):
+        bottom = min(top + tile_rows, height)
+        tile = np.asarray(img.crop((0, top, width, bottom)))
+        parity_map(tile, img.mode.endswith("A"), out=analysis[top:bottom])
+    if as_array:
+        return analysis
+    return Image.fromarray(analysis, img.mode)
+
+
+def steganalyse_batch(
+    images: Union[np.ndarray, List[Image.Image]], alpha: bool = False
+) -> np.ndarray:
+    """
+    Steganlysis of the LSB technique for a stack of images of the same size and
+    mode, given as an array or as a list of images.
+    """
+    if isinstance(images, np.ndarray):
+        return parity_map(images, alpha)
+    pixels = np.stack([np.asarray(img) for img in images])
+    return parity_map(pixels, images[0].mode.endswith("A"))
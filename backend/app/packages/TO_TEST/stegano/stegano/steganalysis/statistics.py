@@ -25,35 +25,204 @@ __date__ = "$Date: 2010/10/01 $"
 __revision__ = "$Date: 2016/08/26 $"
 __license__ = "GPLv3"
 
-import typing
-import operator
+import functools
+import itertools
+import math
+from typing import List, NamedTuple, Tuple, Union
 
+import numpy as np
 from PIL import Image
-from collections import Counter
-from collections import OrderedDict
 
+# Rows of the images processed at once by analyse
+TILE_ROWS = 256
+# Pixels of the groups of the RS analysis, the two in the middle are flipped
+GROUP_SIZE = 4
+# Flips of the RS analysis: F1 (0 <-> 1, 2 <-> 3...) and F-1 (-1 <-> 0, 1 <-> 2...)
+FLIPS = [lambda x: x ^ 1, lambda x: ((x + 1) ^ 1) - 1]
 
-def steganalyse(img):
+
+class Statistics(NamedTuple):
+    """Result of the analysis of an image, or of a batch of images.
+
+    histograms: count of each value, per channel
+    chi_square: probability of embedding given by the pair of values attack,
+                per channel
+    rs: embedding rate estimated by the RS analysis, per channel
+    score: embedding rate estimated for the image, between 0 and 1
     """
-    Steganlysis of the LSB technique.
+
+    histograms: np.ndarray
+    chi_square: np.ndarray
+    rs: np.ndarray
+    score: np.ndarray
+
+
+def chi_square(histograms: np.ndarray) -> np.ndarray:
+    """Pair of values attack: after an embedding in the least significant bits
+    the values 2k and 2k + 1 have close counts. Returns the probability that
+    the histograms have been equalised this way.
     """
-    encoded = img.copy()
-    width, height = img.size
-    colours_counter = Counter()  # type: typing.Counter[int]
-    for row in range(height):
-        for col in range(width):
-            r, g, b = img.getpixel((col, row))
-            colours_counter[r] += 1
-
-    most_common = colours_counter.most_common(10)
-    dict_colours = OrderedDict(
-        sorted(list(colours_counter.items()), key=lambda t: t[1])
+    even: np.ndarray = histograms[..., 0::2].astype(float)
+    expected = (even + histograms[..., 1::2]) / 2
+    used = expected > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(used, (even - expected) ** 2 / expected, 0)
+    statistic = terms.sum(axis=-1)
+    freedom = np.maximum(used.sum(axis=-1) - 1, 1)
+    # Survival function of the chi-square distribution, with the
+    # Wilson-Hilferty approximation
+    variance = 2 / (9 * freedom)
+    z = ((statistic / freedom) ** (1 / 3) - (1 - variance)) / np.sqrt(variance)
+    survival = np.vectorize(lambda z: math.erfc(z / math.sqrt(2)) / 2)(z)
+    return np.asarray(survival, dtype=float)
+
+
+@functools.lru_cache(maxsize=None)
+def _rs_tables() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Change of the three terms |x1 - x0|, |x2 - x1| and |x3 - x2| of the
+    # discrimination function when x1 and x2 are flipped, for each pair of
+    # values. The four bytes of an entry are, made positive, the changes for
+    # F1 and F-1 in the image and in the image with its LSB all flipped.
+    u, v = np.divmod(np.arange(256 * 256), 256)
+    tables: List[np.ndarray] = [np.zeros(256 * 256, dtype="<u4") for _ in range(3)]
+    for lane, (flip, lsb) in enumerate(itertools.product(FLIPS, [0, 1])):
+        x, y = u ^ lsb, v ^ lsb
+        changes = [
+            np.abs(flip(y) - x) - np.abs(y - x) + 1,
+            np.abs(flip(y) - flip(x)) - np.abs(y - x) + 2,
+            np.abs(y - flip(x)) - np.abs(y - x) + 1,
+        ]
+        for table, change in zip(tables, changes):
+            table |= change.astype("<u4") << (8 * lane)
+    left, middle, right = tables
+    return left, middle, right
+
+
+def _regular_singular(tile: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Number of regular and singular groups per image, channel and lane of
+    # the tables, for a tile of shape (images, channels, rows, width)
+    x0, x1, x2, x3 = (tile[..., i::GROUP_SIZE] for i in range(GROUP_SIZE))
+    left, middle, right = _rs_tables()
+
+    def pair(x, y):
+        return (x.astype(np.uint16) << 8) | y
+
+    # The changes are at most 2 for the three terms: no carry between bytes
+    changes = left[pair(x0, x1)] + middle[pair(x1, x2)] + right[pair(x2, x3)]
+
+    # Bit 3 of the bytes tells if the discrimination function increased
+    # (regular group) or decreased (singular group), the bits of the four
+    # bytes are then gathered in a code counted with a histogram
+    regular = ((changes + 0x03030303) >> 3) & 0x01010101
+    singular = (~(changes + 0x04040404) >> 3) & 0x01010101
+    codes = ((regular * 0x01020408) >> 24) | (((singular * 0x01020408) >> 20) & 0xF0)
+    nimages, nchannels = codes.shape[:2]
+    histograms = np.array(
+        [
+            np.bincount(code, minlength=256)
+            for code in codes.reshape(nimages * nchannels, -1)
+        ]
+    ).reshape(nimages, nchannels, 256)
+    groups = histograms @ ((np.arange(256)[:, None] >> np.arange(8)) & 1)
+    return groups[..., :4], groups[..., 4:]
+
+
+def rs_rate(counts: np.ndarray, flipped_counts: np.ndarray) -> np.ndarray:
+    """Embedding rate estimated by the RS analysis (Fridrich, Goljan and Du)
+    from the proportions of regular and singular groups (R_M, S_M, R_-M, S_-M)
+    in the images and in the images with all their least significant bits
+    flipped.
+    """
+    r_m, s_m, r_n, s_n = counts
+    r_m1, s_m1, r_n1, s_n1 = flipped_counts
+    d0, d1 = r_m - s_m, r_m1 - s_m1
+    dn0, dn1 = r_n - s_n, r_n1 - s_n1
+    a = 2 * (d1 + d0)
+    b = dn0 - dn1 - d1 - 3 * d0
+    c = d0 - dn0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        root = np.sqrt(np.maximum(b * b - 4 * a * c, 0))
+        roots = np.stack([(-b + root) / (2 * a), (-b - root) / (2 * a)])
+        # Linear equation when a is zero
+        roots = np.where(a == 0, -c / b, roots)
+        x = np.take_along_axis(roots, np.abs(roots).argmin(axis=0)[None], 0)[0]
+        rate = x / (x - 0.5)
+    return np.clip(np.nan_to_num(rate), 0, 1)
+
+
+def analyse(
+    images: Union[Image.Image, np.ndarray, List[Image.Image]]
+) -> Statistics:
+    """Statistics of an image, or of a batch of images of the same size given
+    as a list or an array of shape (images, height, width, channels). Only the
+    colour channels are analysed.
+    """
+    def colours(img: Image.Image) -> np.ndarray:
+        return np.asarray(img if img.mode in ["L", "RGB"] else img.convert("RGB"))
+
+    batch = isinstance(images, list) or (
+        not isinstance(images, Image.Image) and np.ndim(images) == 4
     )
+    if isinstance(images, Image.Image):
+        pixels = colours(images)
+    elif isinstance(images, list):
+        pixels = np.stack([colours(img) for img in images])
+    else:
+        pixels = np.asarray(images, dtype=np.uint8)
+    # Channel axis of grayscale images, then batch axis of a single image
+    if pixels.ndim == 2 or (pixels.ndim == 3 and batch):
+        pixels = pixels[..., None]
+    if pixels.ndim == 3:
+        pixels = pixels[None]
+    pixels = pixels[..., :3]
+
+    # One pass over the images, by tiles of rows
+    nimages, height, width, nchannels = pixels.shape
+    counts = np.zeros((nimages, nchannels, 256), dtype=np.int64)
+    regular = np.zeros((nimages, nchannels, 4), dtype=np.int64)
+    singular = np.zeros((nimages, nchannels, 4), dtype=np.int64)
+    ngroups = height * (width // GROUP_SIZE)
+    for top in range(0, height, TILE_ROWS):
+        # Channels first, contiguous rows of values
+        tile = np.ascontiguousarray(
+            pixels[:, top : top + TILE_ROWS].transpose(0, 3, 1, 2)
+        )
+        for image in range(nimages):
+            for channel in range(nchannels):
+                counts[image, channel] += np.bincount(
+                    tile[image, channel].reshape(-1), minlength=256
+                )
+        tile_regular, tile_singular = _regular_singular(
+            tile[..., : width - width % GROUP_SIZE]
+        )
+        regular += tile_regular
+        singular += tile_singular
 
-    colours = 0  # type: float
-    for colour in list(dict_colours.keys()):
-        colours += colour
-    colours = colours / len(dict_colours)
+    # R_M, S_M, R_-M and S_-M, in the image then with its LSB flipped
+    groups = np.stack([regular, singular], axis=-1) / max(ngroups, 1)
+    groups = groups.reshape(nimages, nchannels, 2, 2, 2).transpose(3, 2, 4, 0, 1)
+    probabilities = chi_square(counts)
+    rates = rs_rate(*groups.reshape(2, 4, nimages, nchannels))
+    result = Statistics(counts, probabilities, rates, rates.mean(axis=-1))
+    if batch:
+        return result
+    return Statistics(*(value[0] for value in result))
+
+
+def steganalyse(img):
+    """
+    Steganlysis of the LSB technique.
+
+    Returns the values of the red channel by increasing number of
+    occurrences (the 30 first ones) and the 10 most common values with their
+    number of occurrences.
+    """
+    red = np.asarray(img.convert("RGB") if img.mode != "RGB" else img)[..., 0]
+    counts = np.bincount(red.reshape(-1), minlength=256)
+    # The values in order of first appearance, like the keys of a Counter
+    values, first = np.unique(red, return_index=True)
+    values = values[np.argsort(first, kind="stable")].tolist()
 
-    # return colours.most_common(10)
-    return list(dict_colours.keys())[:30], most_common
+    by_count = sorted(values, key=lambda value: counts[value])
+    most_common = sorted(values, key=lambda value: counts[value], reverse=True)
+    return by_count[:30], [(value, int(counts[value])) for value in most_common[:10]]
@@ -30,6 +30,7 @@ import itertools
 from functools import reduce
 from typing import IO, Iterator, List, Tuple, Union
 
+import numpy as np
 from PIL import Image
 
 ENCODINGS = {"UTF-8": 8, "UTF-32LE": 32}
@@ -66,6 +67,42 @@ def a2bits_list(chars: str, encoding: str = "UTF-8") -> List[str]:
     return [bin(ord(x))[2:].rjust(ENCODINGS[encoding], "0") for x in chars]
 
 
+def a2bits_array(chars: str, encoding: str = "UTF-8") -> np.ndarray:
+    """Convert a string to its bits representation as an array of 0's and 1's,
+    identical to "".join(a2bits_list(chars, encoding)).
+
+    >>> a2bits_array("Hi")
+    array([0, 1, 0, 0, 1, 0, 0, 0, 0, 1, 1, 0, 1, 0, 0, 1], dtype=uint8)
+    """
+    try:
+        # One byte per character, or 4 big endian bytes per character
+        data = chars.encode("latin-1" if ENCODINGS[encoding] == 8 else "utf-32-be")
+    except UnicodeEncodeError:
+        # Characters wider than the encoding take more bits, like in a2bits_list
+        bits = "".join(a2bits_list(chars, encoding)).encode("ascii")
+        return np.frombuffer(bits, dtype=np.uint8) - ord("0")
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+
+
+def bits2codes(bits: np.ndarray, encoding: str = "UTF-8") -> np.ndarray:
+    """Convert an array of 0's and 1's to the code points of the characters.
+
+    >>> bits2codes(a2bits_array("Hi"))
+    array([ 72, 105], dtype=uint8)
+    """
+    width = ENCODINGS[encoding]
+    bits = bits[: len(bits) - len(bits) % width]
+    return np.packbits(bits).view(">u%d" % (width // 8))
+
+
+def codes2a(codes: np.ndarray) -> str:
+    """Convert an array of code points to a string.
+    """
+    if codes.dtype.itemsize == 1:
+        return codes.tobytes().decode("latin-1")
+    return "".join(map(chr, codes.tolist()))
+
+
 def bs(s: int) -> str:
     """Converts an int to its bits representation as a string of 0's and 1's.
     """
@@ -25,9 +25,15 @@ __date__ = "$Date: 2016/05/17 $"
 __revision__ = "$Date: 2017/01/18 $"
 __license__ = "GPLv3"
 
+import base64
 import os
 import unittest
 import io
+import zlib
+from unittest.mock import patch
+
+import piexif
+from PIL import Image
 
 from stegano import exifHeader
 
@@ -100,11 +106,102 @@ class TestEXIFHeader(unittest.TestCase):
             clear_message = exifHeader.reveal(outputBytes)
             self.assertEqual(message, clear_message)
 
+    def test_jpeg_is_not_encoded_again(self):
+        exifHeader.hide(
+            "./tests/sample-files/Lenna.jpg", "./image.jpg", secret_message="Secret"
+        )
+        with open("./tests/sample-files/Lenna.jpg", "rb") as f:
+            original = f.read()
+        with open("./image.jpg", "rb") as f:
+            encoded = f.read()
+        # The start of scan segment and the entropy-coded data are kept
+        sos = b"\xff\xda"
+        self.assertEqual(original[original.index(sos) :], encoded[encoded.index(sos) :])
+        self.assertEqual(exifHeader.reveal("./image.jpg"), b"Secret")
+
+        # The EXIF segment is replaced when hiding again
+        exifHeader.hide("./image.jpg", "./image.jpg", secret_message="foo")
+        self.assertEqual(exifHeader.reveal("./image.jpg"), b"foo")
+        with open("./image.jpg", "rb") as f:
+            self.assertEqual(f.read().count(b"Exif\x00\x00"), 1)
+
+    def test_with_tiff_image(self):
+        img = Image.open("./tests/sample-files/Lenna.png")
+        img.save("./image.tif")
+        exifHeader.hide("./image.tif", "./image.tif", secret_message="Hello World!")
+
+        self.assertEqual(exifHeader.reveal("./image.tif"), b"Hello World!")
+        with Image.open("./image.tif") as encoded:
+            self.assertEqual(encoded.tobytes(), img.tobytes())
+
+    def test_with_large_secret(self):
+        message = os.urandom(300000)
+        exifHeader.hide("./tests/sample-files/Lenna.jpg", "./image.jpg", secret_message=message)
+        with open("./image.jpg", "rb") as f:
+            self.assertEqual(f.read().count(exifHeader.PAYLOAD_MAGIC), 5)
+        self.assertEqual(exifHeader.reveal("./image.jpg"), message)
+        with Image.open("./image.jpg") as img:
+            self.assertEqual(exifHeader.reveal(img), message)
+
+        # The chunks are removed when a smaller secret is hidden
+        exifHeader.hide("./image.jpg", "./image.jpg", secret_message="foo")
+        with open("./image.jpg", "rb") as f:
+            self.assertEqual(f.read().count(exifHeader.PAYLOAD_MAGIC), 1)
+        self.assertEqual(exifHeader.reveal("./image.jpg"), b"foo")
+        with Image.open("./image.jpg") as img:
+            self.assertEqual(exifHeader.reveal(img), b"foo")
+
+    def test_with_missing_chunk(self):
+        exifHeader.hide(
+            "./tests/sample-files/Lenna.jpg", "./image.jpg", secret_message=os.urandom(100000)
+        )
+        with open("./image.jpg", "rb") as f:
+            data = f.read()
+        position = data.index(exifHeader.PAYLOAD_MAGIC)
+        with open("./image.jpg", "wb") as f:
+            f.write(data[:position] + b"X" + data[position + 1 :])
+        with self.assertRaises(ValueError):
+            exifHeader.reveal("./image.jpg")
+
+    def test_without_secret(self):
+        with self.assertRaises(ValueError):
+            exifHeader.hide("./tests/sample-files/Lenna.jpg", "./image.jpg")
+
+    def test_reveal_base64_secret(self):
+        """Secrets hidden by previous versions: compressed base64 text.
+        """
+        description = zlib.compress(base64.b64encode(b"Secret"))
+        exif = piexif.dump({"0th": {piexif.ImageIFD.ImageDescription: description}})
+        Image.open("./tests/sample-files/Lenna.jpg").save("./image.jpg", exif=exif)
+        self.assertEqual(exifHeader.reveal("./image.jpg"), b"Secret")
+
+    def test_reveal_reads_headers_only(self):
+        exifHeader.hide("./tests/sample-files/Lenna.jpg", "./image.jpg", secret_message="foo")
+        with patch("PIL.Image.open", side_effect=AssertionError):
+            self.assertEqual(exifHeader.reveal("./image.jpg"), b"foo")
+            with open("./image.jpg", "rb") as f:
+                self.assertEqual(exifHeader.reveal(io.BytesIO(f.read())), b"foo")
+
+    def test_tiff_tag(self):
+        exifHeader.hide("./tests/sample-files/Lenna.jpg", "./image.jpg", secret_message="foo")
+        with open("./image.jpg", "rb") as f:
+            data = f.read()
+        start = data.index(b"Exif\x00\x00") + 6
+        self.assertEqual(
+            exifHeader.tiff_tag(data, piexif.ImageIFD.ImageDescription, start),
+            piexif.load(data)["0th"][piexif.ImageIFD.ImageDescription],
+        )
+        self.assertIsNone(exifHeader.tiff_tag(data, piexif.ImageIFD.Artist, start))
+
     def tearDown(self):
         try:
             os.unlink("./image.jpg")
         except:
             pass
+        try:
+            os.unlink("./image.tif")
+        except:
+            pass
         try:
             os.unlink("./image.png")
         except:
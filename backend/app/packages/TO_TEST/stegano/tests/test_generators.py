@@ -28,7 +28,9 @@ __license__ = "GPLv3"
 import unittest
 import itertools
 
-from stegano.lsbset import generators
+import numpy as np
+
+from stegano.lsbset import generators, sequences
 
 
 class TestGenerators(unittest.TestCase):
@@ -123,6 +125,29 @@ class TestGenerators(unittest.TestCase):
                 tuple(int(line) for line in f),
             )
 
+    def test_bounded_sieves(self):
+        """Test the bound of the sieve based generators.
+        """
+        self.assertEqual(list(generators.eratosthenes(30)), [2, 3, 5, 7, 11, 13, 17, 19, 23, 29])
+        self.assertEqual(list(generators.composite(13)), [4, 6, 8, 9, 10, 12])
+        self.assertEqual(list(generators.carmichael(3000)), [561, 1105, 1729, 2465, 2821])
+        self.assertEqual(list(generators.eratosthenes(2)), [])
+
+    def test_segmented_sieve(self):
+        """Test the segments of the sieve against a plain sieve.
+        """
+        expected = np.flatnonzero(sequences.sieve(10 ** 5))
+        for segment_size in [7, 1000, 2 ** 16]:
+            primes = np.concatenate(list(sequences.segmented_sieve(10 ** 5, segment_size)))
+            self.assertEqual(primes.tolist(), expected.tolist())
+
+    def test_carmichael_large_bound(self):
+        """The Carmichael numbers below the pixel count of a 4K image.
+        """
+        numbers = list(generators.carmichael(3840 * 2160))
+        self.assertEqual(len(numbers), 93)
+        self.assertEqual(numbers[-1], 8134561)
+
     def test_ackermann_slow(self):
         """Test the Ackermann set.
         """
@@ -166,6 +191,75 @@ class TestGenerators(unittest.TestCase):
                 tuple(int(line) for line in f),
             )
 
+    def test_LFSR_all_polynomials(self):
+        """Test the LFSR generator against the bit list implementation.
+        """
+
+        def reference(m):
+            n = m.bit_length() - 1
+            state = [1] + [0] * (n - 1)
+            while True:
+                feedback = 0
+                for tap in generators.polys[n]:
+                    feedback ^= state[tap - 1]
+                state.pop()
+                state.insert(0, feedback)
+                yield sum(e * 2 ** i for i, e in enumerate(state))
+
+        for n in generators.polys:
+            count = min(2 ** n + 10, 3000)
+            expected = tuple(itertools.islice(reference(2 ** n), count))
+            self.assertEqual(tuple(itertools.islice(generators.LFSR(2 ** n), count)), expected)
+            self.assertEqual(tuple(generators.TAKE["LFSR"](count, 2 ** n, 2 ** n)), expected)
+
+    def test_LFSR_galois(self):
+        """The Galois LFSR goes through all the non zero states.
+        """
+        for n in range(2, 17):
+            states = generators.TAKE["LFSR_galois"](2 ** n, 2 ** n, 2 ** n)
+            self.assertEqual(len(set(states[:-1].tolist())), 2 ** n - 1)
+            self.assertEqual(states[-1], states[0])
+        self.assertEqual(
+            tuple(itertools.islice(generators.LFSR_galois(2 ** 20), 5000)),
+            tuple(generators.TAKE["LFSR_galois"](5000, 2 ** 20, 2 ** 20)),
+        )
+
+    def test_take(self):
+        """Test the bulk versions of the generators.
+        """
+        for name, args in [
+            ("identity", ()),
+            ("triangular_numbers", ()),
+            ("fermat", ()),
+            ("mersenne", ()),
+            ("eratosthenes", ()),
+            ("composite", ()),
+            ("carmichael", ()),
+            ("ackermann", (3,)),
+            ("fibonacci", ()),
+            ("log_gen", ()),
+            ("LFSR", (2 ** 8,)),
+            ("LFSR_galois", (2 ** 8,)),
+        ]:
+            generator = getattr(generators, name)
+            for n, limit in [(0, 1000), (1, 1000), (50, 1000), (500, 3), (300, 2000)]:
+                expected = list(
+                    itertools.takewhile(
+                        lambda value: value < limit,
+                        itertools.islice(generator(*args), n),
+                    )
+                )
+                values = generators.TAKE[name](n, limit, *args)
+                self.assertEqual(values.dtype, np.int64)
+                self.assertEqual(values.tolist(), expected, (name, n, limit))
+
+    def test_take_LFSR_limit(self):
+        """The bulk LFSR stops before the first value which is not below limit.
+        """
+        values = generators.TAKE["LFSR"](100, 200, 2 ** 8)
+        self.assertEqual(values.tolist(), list(itertools.islice(generators.LFSR(2 ** 8), len(values))))
+        self.assertLess(len(values), 100)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -51,6 +51,52 @@ class TestLSB(unittest.TestCase):
             clear_message = lsb.reveal("./image.png")
             self.assertEqual(message, clear_message)
 
+    def test_hide_and_reveal_with_shift(self):
+        messages_to_hide = ["a", "foo", "Hello World!", ":Python:"]
+        for message in messages_to_hide:
+            secret = lsb.hide("./tests/sample-files/Lenna.png", message, shift=4)
+            secret.save("./image.png")
+
+            clear_message = lsb.reveal("./image.png", shift=4)
+            self.assertEqual(message, clear_message)
+
+    def test_hide_and_reveal_with_binary_header(self):
+        messages_to_hide = ["a", "Hello World!", ":Python:", "I love 🍕 and 🍫!"]
+        for encoding in ["UTF-8", "UTF-32LE"]:
+            for message in messages_to_hide:
+                secret = lsb.hide(
+                    "./tests/sample-files/Lenna.png",
+                    message,
+                    encoding=encoding,
+                    shift=3,
+                    binary_header=True,
+                )
+                secret.save("./image.png")
+
+                clear_message = lsb.reveal("./image.png", shift=3)
+                self.assertEqual(message, clear_message)
+
+    def test_hide_and_reveal_bytes_with_binary_header(self):
+        with open("./tests/sample-files/free-software-song.ogg", "rb") as f:
+            message = f.read()
+        secret = lsb.hide(
+            "./tests/sample-files/Montenach.png", message, binary_header=True
+        )
+        self.assertEqual(message, lsb.reveal(secret))
+
+    def test_reveal_corrupted_binary_header(self):
+        secret = lsb.hide(
+            "./tests/sample-files/Lenna.png", "Hello World!", binary_header=True
+        )
+        # Flip the LSB of the first component of the last pixel of the message
+        pixel = secret.getpixel((50, 0))
+        secret.putpixel((50, 0), (pixel[0] ^ 1,) + pixel[1:])
+        with self.assertRaises(ValueError):
+            lsb.reveal(secret)
+
+    def test_reveal_without_message(self):
+        self.assertIsNone(lsb.reveal("./tests/sample-files/Lenna.png"))
+
     def test_hide_and_reveal_UTF32LE(self):
         messages_to_hide = "I love 🍕 and 🍫!"
         secret = lsb.hide(
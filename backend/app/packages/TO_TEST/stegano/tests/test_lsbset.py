@@ -27,11 +27,14 @@ __license__ = "GPLv3"
 
 import io
 import os
+import tempfile
 import unittest
 from unittest.mock import patch
 
+import numpy as np
+
 from stegano import lsbset
-from stegano.lsbset import generators
+from stegano.lsbset import cache, generators
 
 
 class TestLSBSet(unittest.TestCase):
@@ -182,6 +185,45 @@ class TestLSBSet(unittest.TestCase):
                 generators.eratosthene(),
             )
 
+    def test_hide_and_reveal_with_iterator(self):
+        message = "Hello World!"
+        secret = lsbset.hide(
+            "./tests/sample-files/Lenna.png", message, iter(range(7, 10 ** 6, 3)), 2
+        )
+        clear_message = lsbset.reveal(secret, iter(range(7, 10 ** 6, 3)), 2)
+        self.assertEqual(message, clear_message)
+
+    def test_index_cache(self):
+        index_cache = cache.IndexCache(maxsize=2)
+        table = index_cache.get("eratosthenes", (None,), (10, 10), 2, 5)
+        self.assertEqual(table.tolist(), [5, 7, 11, 13, 17])
+        # The table grows when more indices are needed, up to the pixel count
+        table = index_cache.get("eratosthenes", (None,), (10, 10), 2, 100)
+        self.assertEqual(table.tolist()[-1], 97)
+        self.assertEqual(len(table), 23)
+        index_cache.get("identity", (), (10, 10), 0, 5)
+        index_cache.get("identity", (), (20, 10), 0, 5)
+        self.assertEqual(len(index_cache._tables), 2)
+
+    def test_index_cache_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            index_cache = cache.IndexCache(directory=directory)
+            expected = index_cache.get("LFSR", (2 ** 10,), (32, 32), 3, 100)
+            index_cache.clear()
+            table = index_cache.get("LFSR", (2 ** 10,), (32, 32), 3, 50)
+            self.assertIsInstance(table.base, np.memmap)
+            self.assertEqual(table.tolist(), expected[:50].tolist())
+
+    def test_describe_generator(self):
+        self.assertEqual(cache.describe(generators.LFSR(64)), ("LFSR", (64,)))
+        self.assertEqual(
+            cache.describe(generators.eratosthenes()), ("eratosthenes", (None,))
+        )
+        started = generators.identity()
+        next(started)
+        self.assertIsNone(cache.describe(started))
+        self.assertIsNone(cache.describe(iter(range(10))))
+
     def tearDown(self):
         try:
             os.unlink("./image.png")
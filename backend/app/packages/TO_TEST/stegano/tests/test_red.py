@@ -27,6 +27,9 @@ __license__ = "GPLv3"
 import os
 import unittest
 
+import numpy as np
+from PIL import Image
+
 from stegano import red
 
 
@@ -47,11 +50,37 @@ class TestRed(unittest.TestCase):
 
             clear_message = red.reveal("./image.png")
 
-            self.assertEqual(message, message)
+            self.assertEqual(message, clear_message)
+
+    def test_hide_and_reveal_long_message(self):
+        with open("./tests/sample-files/lorem_ipsum.txt") as f:
+            message = f.read()
+        secret = red.hide("./tests/sample-files/Lenna.png", message)
+        secret.save("./image.png")
+
+        self.assertEqual(red.reveal("./image.png"), message)
+
+    def test_hide_and_reveal_other_modes(self):
+        message = "Hello World!" * 30
+        for mode in ["L", "RGBA"]:
+            img = Image.open("./tests/sample-files/Lenna.png").convert(mode)
+            secret = red.hide(img, message)
+            self.assertEqual(secret.mode, mode)
+            self.assertEqual(red.reveal(secret), message)
+
+    def test_hide_changes_first_red_values(self):
+        img = Image.new("RGB", (4, 3), (0, 7, 9))
+        secret = red.hide(img, "abcde")
+        pixels = np.asarray(secret)
+        self.assertEqual(pixels[:2, :, 0].reshape(-1)[:6].tolist(), [5, 97, 98, 99, 100, 101])
+        # Only the red values of the message are changed
+        self.assertEqual((pixels[:, :, 1:] == [7, 9]).all(), True)
+        self.assertEqual(pixels.reshape(-1, 3)[6:, 0].tolist(), [0] * 6)
 
     def test_with_too_long_message(self):
         with open("./tests/sample-files/lorem_ipsum.txt") as f:
             message = f.read()
+        message *= -(-512 * 512 // len(message))
         with self.assertRaises(AssertionError):
             red.hide("./tests/sample-files/Lenna.png", message)
 
@@ -31,6 +31,8 @@ import base64
 import unittest
 from unittest.mock import patch
 
+import numpy as np
+
 from stegano import lsb
 from stegano.steganalysis import parity, statistics
 from PIL import Image, ImageChops
@@ -58,6 +60,21 @@ class TestSteganalysis(unittest.TestCase):
         diff = ImageChops.difference(target, analysis).getbbox()
         self.assertTrue(diff is None)
 
+    def test_parity_tiles_and_batch(self):
+        """ Test the tiles, array output and batch of stegano.steganalysis.parity
+        """
+        img = Image.open("./tests/sample-files/Lenna.png")
+        expected = parity.steganalyse(img, as_array=True, tile_rows=None)
+        self.assertEqual(expected.dtype, np.uint8)
+        self.assertEqual(sorted(np.unique(expected).tolist()), [0, 255])
+        self.assertTrue(np.array_equal(parity.steganalyse(img, as_array=True, tile_rows=100), expected))
+
+        secret = lsb.hide("./tests/sample-files/Lenna.png", "Hello World!")
+        batch = parity.steganalyse_batch([img, secret])
+        self.assertEqual(batch.shape, (2,) + expected.shape)
+        self.assertTrue(np.array_equal(batch[0], expected))
+        self.assertTrue(np.array_equal(batch[1], parity.steganalyse(secret, as_array=True)))
+
     def test_statistics(self):
         """ Test stegano.steganalysis.statistics
         """
@@ -68,6 +85,55 @@ class TestSteganalysis(unittest.TestCase):
         file.close()
         self.assertEqual(stats, target)
 
+    def test_statistics_analyse(self):
+        """ Test the chi-square and RS analysis of stegano.steganalysis.statistics
+        """
+        img = Image.open("./tests/sample-files/Lenna.png")
+        pixels = np.array(img)
+        # Random message in the least significant bits of all the values, and
+        # of half of them
+        random = np.random.RandomState(0)
+        embedded = (pixels & 0xFE) | random.randint(0, 2, pixels.shape).astype(np.uint8)
+        half = np.where(random.rand(*pixels.shape) < 0.5, embedded, pixels)
+
+        clean = statistics.analyse(img)
+        self.assertEqual(clean.histograms.shape, (3, 256))
+        self.assertEqual(clean.histograms.sum(), pixels.size)
+        red = np.bincount(pixels[..., 0].reshape(-1), minlength=256)
+        self.assertTrue(np.array_equal(clean.histograms[0], red))
+        self.assertLess(clean.score, 0.1)
+        self.assertTrue((clean.chi_square < 0.1).all())
+
+        gray = img.convert("L")
+        analysis = statistics.analyse(gray)
+        self.assertEqual(analysis.histograms.shape, (1, 256))
+        self.assertEqual(analysis.histograms.sum(), gray.width * gray.height)
+        self.assertLess(analysis.score, 0.1)
+        array = statistics.analyse(np.asarray(gray))
+        for field, value in zip(analysis._fields, analysis):
+            self.assertTrue(np.array_equal(getattr(array, field), value), field)
+
+        analysis = statistics.analyse(Image.fromarray(embedded))
+        self.assertTrue((analysis.chi_square > 0.9).all())
+        analysis = statistics.analyse(Image.fromarray(half))
+        self.assertAlmostEqual(analysis.score, 0.5, delta=0.1)
+
+    def test_statistics_batch(self):
+        """ Test stegano.steganalysis.statistics with a batch of images
+        """
+        img = Image.open("./tests/sample-files/Lenna.png")
+        secret = lsb.hide("./tests/sample-files/Lenna.png", "Hello World!" * 1000)
+        batch = statistics.analyse([img, secret])
+        self.assertEqual(batch.histograms.shape, (2, 3, 256))
+        self.assertEqual(batch.score.shape, (2,))
+        for i, image in enumerate([img, secret]):
+            single = statistics.analyse(image)
+            for field, value in zip(single._fields, single):
+                self.assertTrue(np.allclose(getattr(batch, field)[i], value), field)
+        array = statistics.analyse(np.array(secret))
+        self.assertTrue(np.array_equal(array.rs, batch.rs[1]))
+        self.assertGreater(batch.score[1], batch.score[0])
+
 
 if __name__ == "__main__":
     unittest.main()
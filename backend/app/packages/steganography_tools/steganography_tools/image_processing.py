@@ -24,45 +24,201 @@ __revision__ = "$Date: 2021/04/01 $"
 __license__ = "GPLv3"
 
 # Imports
+import collections
+import hashlib
+import io
+import threading
+import types
+import typing
+
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import scipy
 from scipy import ndimage
 import cv2
 import imageio
 from PIL import Image, ExifTags
 
-def img_information(img):
+# Processing stages: headless ndarray -> ndarray functions, composable with compose().
+# Every stage accepts an optional out= buffer and never opens a matplotlib figure.
+
+def read_image(img):
+    "Return the image as an array, reading it only if a path is given."
+    if isinstance(img, np.ndarray):
+        return img
+    return imageio.imread(img)
+
+def compose(*stages):
+    "Chain processing stages (use functools.partial to set their parameters)."
+    def pipeline(img, out=None):
+        for stage in stages[:-1]:
+            img = stage(img)
+        return stages[-1](img, out=out) if stages else img
+    return pipeline
+
+def grayscale(img, out=None):
+    "Convert a RGB(A) image to grayscale with the ITU-R 601-2 luma transform, like PIL."
+    if img.ndim == 2:
+        luma = img
+    else:
+        # L = R * 299/1000 + G * 587/1000 + B * 114/1000, in 16 bits fixed point
+        luma = np.multiply(img[:, :, 0], 19595, dtype=np.uint32)
+        luma += np.multiply(img[:, :, 1], 38470, dtype=np.uint32)
+        luma += np.multiply(img[:, :, 2], 7471, dtype=np.uint32)
+        luma += 0x8000
+        luma >>= 16
+    if out is None:
+        return luma.astype(img.dtype)
+    np.copyto(out, luma, casting="unsafe")
+    return out
+
+def binarize(img, threshold=65, out=None):
+    "Black or white pixels according to a given threshold."
+    if out is None:
+        out = np.empty(img.shape, dtype=np.uint8)
+    # White pixels (255) above the threshold, black pixels (0) otherwise
+    np.greater(img, threshold, out=out, casting="unsafe")
+    out *= 255
+    return out
+
+def _spatial(img, value, channel):
+    "Per axis parameter of a filter, which leaves the channel axis of a color image alone."
+    return (value, value) + (channel,) * (img.ndim - 2)
+
+def blur(img, sigma=3, out=None):
+    "Blur with a gaussian filter."
+    return ndimage.gaussian_filter(img, sigma=_spatial(img, sigma, 0), output=out)
+
+def local_mean(img, size=11, out=None):
+    "Blur with a uniform filter."
+    return ndimage.uniform_filter(img, size=_spatial(img, size, 1), output=out)
+
+def sharpen(img, alpha=30, sigma=3, out=None):
+    "Sharpen a blurred image by adding a Laplacian approximation to increase the weight of the edges."
+    blurred = ndimage.gaussian_filter(img.astype(np.float32), _spatial(img, sigma, 0))
+    filter_blurred = ndimage.gaussian_filter(blurred, _spatial(img, 1, 0))
+    # blurred + alpha * (blurred - filter_blurred), computed in place
+    filter_blurred -= blurred
+    filter_blurred *= -alpha
+    filter_blurred += blurred
+    if out is None:
+        out = np.empty(img.shape, dtype=img.dtype)
+    if np.issubdtype(out.dtype, np.integer):
+        info = np.iinfo(out.dtype)
+        np.clip(filter_blurred, info.min, info.max, out=filter_blurred)
+    np.copyto(out, filter_blurred, casting="unsafe")
+    return out
+
+def add_noise(img, scale=0.4, seed=None, out=None):
+    "Add uniform noise with an amplitude of scale times the standard deviation of the image."
+    noise = np.random.RandomState(seed).random_sample(img.shape)
+    noise *= scale * img.std()
+    return np.add(img, noise, out=out)
+
+def denoise(img, method="median", size=3, sigma=2, out=None):
+    "Smooth noise and the edges using a median or a gaussian filter."
+    if method == "median":
+        return ndimage.median_filter(img, size=_spatial(img, size, 1), output=out)
+    if method == "gaussian":
+        return ndimage.gaussian_filter(img, sigma=_spatial(img, sigma, 0), output=out)
+    raise ValueError("Unknown denoising method: %s" % method)
+
+class ImageMetadata(typing.NamedTuple):
+    "Metadata read from the headers of an image, without decoding its pixels."
+    format: typing.Optional[str]
+    mode: str
+    size: typing.Tuple[int, int]
+    palette: typing.Optional[bytes]
+    exif: typing.Mapping[str, typing.Any]
+
+# Metadata already read, by content hash, with the least recently used entries evicted first
+METADATA_CACHE_SIZE = 256
+_metadata_cache = collections.OrderedDict()
+_metadata_lock = threading.Lock()
+
+def _read_bytes(img):
+    "Return the content of an image given as a path, bytes or a file object."
+    if isinstance(img, (bytes, bytearray, memoryview)):
+        return bytes(img)
+    if hasattr(img, "read"):
+        position = img.tell()
+        data = img.read()
+        img.seek(position)
+        return data
+    with open(img, "rb") as f:
+        return f.read()
+
+# Pointers of IFD0 to the Exif and GPS IFDs
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+
+def _exif_tags(exif):
+    "Tags of IFD0 and of the Exif IFD by name, with the GPS IFD as a dict, like Image._getexif()."
+    tags = dict(exif)
+    tags.update(exif.get_ifd(EXIF_IFD))
+    if GPS_IFD in tags:
+        tags[GPS_IFD] = dict(exif.get_ifd(GPS_IFD))
+    return { ExifTags.TAGS[k]: v for k, v in tags.items() if k in ExifTags.TAGS }
+
+def _header_exif(image):
+    "EXIF data found in the headers of an opened image."
+    if image.format != "PNG":
+        return image.getexif()
+    # PngImageFile.getexif() calls load() to look for an eXIf chunk after the image data,
+    # only the chunks before it are read
+    exif = Image.Exif()
+    if "exif" in image.info:
+        exif.load(image.info["exif"])
+    return exif
+
+def read_metadata(img):
+    "Return the metadata of an image (path, bytes or file object), memoized by content hash."
+    data = _read_bytes(img)
+    key = hashlib.blake2b(data, digest_size=20).digest()
+    with _metadata_lock:
+        if key in _metadata_cache:
+            _metadata_cache.move_to_end(key)
+            return _metadata_cache[key]
+    # Image.open only parses the headers, the pixels are decoded on load() which is never called
+    with Image.open(io.BytesIO(data)) as image:
+        palette = bytes(image.palette.palette) if image.palette is not None else None
+        exif = _exif_tags(_header_exif(image))
+        metadata = ImageMetadata(image.format, image.mode, image.size, palette, types.MappingProxyType(exif))
+    with _metadata_lock:
+        _metadata_cache[key] = metadata
+        while len(_metadata_cache) > METADATA_CACHE_SIZE:
+            _metadata_cache.popitem(last=False)
+    return metadata
+
+def img_information(img, show=True):
     "This function allows us to get the basic information of an image."
-    # Opening Image as an object
-    image = Image.open(img)
+    metadata = read_metadata(img)
     # Getting the filename of image
-    print("Filename : ",image.filename)
+    print("Filename : ",img if isinstance(img, str) else getattr(img, "name", ""))
     # Getting the format of image
-    print("Format : ",image.format)
+    print("Format : ",metadata.format)
     # Getting the mode of image
-    print("Mode : ",image.mode)
+    print("Mode : ",metadata.mode)
     # Getting the size of image
-    print("Size : ",image.size)
+    print("Size : ",metadata.size)
     # Getting only the width of image
-    print("Width : ",image.width)
+    print("Width : ",metadata.size[0])
     # Getting only the height of image
-    print("Height : ",image.height)
+    print("Height : ",metadata.size[1])
     # Getting the color palette of image
-    print("Image Palette : ",image.palette)
+    print("Image Palette : ",metadata.palette)
     print("\n")
-    # Showing image
-    image.show()
-    # Closing Image object
-    image.close()
+    if show:
+        # Showing image
+        with Image.open(img) as image:
+            image.show()
+    return metadata
     
 def get_metadata(img):
     "Check for potential metadata."
-    # Opening image as an object
-    image = Image.open(img)
-    # Recovering potential image matadat using ExifTags method from PIL
-    exif = { ExifTags.TAGS[k]: v for k, v in image._getexif().items() if k in ExifTags.TAGS }
-    return exif
+    # Recovering potential image metadata from the EXIF header
+    return dict(read_metadata(img).exif)
 
 def rgb2grayscale(img):
     "Convert RGB image to grayscale using PIL"
@@ -75,71 +231,113 @@ def rgb2grayscale(img):
     # Saving image to the current direcrory
     image.save('image_grayscale.jpg')
     
-def plot_histogram(img):
+# Visual helpers: the data to display is computed apart from the drawing, as a list of panels
+# drawn side by side by a renderer. show_panels draws them with pyplot, png_panels renders them
+# off-screen with Agg into PNG bytes and can be used concurrently from worker threads.
+
+class Panel(typing.NamedTuple):
+    "A subplot: an image, or a histogram given as the counts of every pixel value."
+    title: str
+    data: np.ndarray
+    kind: str = "image"
+    vmin: typing.Optional[float] = None
+    vmax: typing.Optional[float] = None
+    fontsize: typing.Optional[int] = None
+
+def _draw_panels(fig, panels, adjust=None):
+    "Draw the panels side by side in a matplotlib figure."
+    for i, panel in enumerate(panels):
+        ax = fig.add_subplot(1, len(panels), i + 1)
+        ax.set_title(panel.title, fontsize=panel.fontsize)
+        if panel.kind == "histogram":
+            ax.bar(np.arange(len(panel.data)), panel.data, width=1)
+            ax.set_xlabel('Pixel value', fontsize=20)
+            ax.set_ylabel('Count', fontsize=20)
+        else:
+            ax.imshow(panel.data, cmap="gray", vmin=panel.vmin, vmax=panel.vmax)
+            ax.axis('off')
+    if adjust:
+        fig.subplots_adjust(**adjust)
+
+def show_panels(panels, figsize, adjust=None):
+    "Draw the panels in a pyplot figure and show it."
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=figsize)
+    _draw_panels(fig, panels, adjust)
+    plt.show()
+    plt.close(fig)
+
+# One reusable Agg figure per thread, pyplot and its global state are never involved
+_figures = threading.local()
+
+def png_panels(panels, figsize, adjust=None, dpi=72):
+    "Render the panels off-screen with the Agg backend and return the PNG bytes."
+    fig = getattr(_figures, "figure", None)
+    if fig is None:
+        fig = _figures.figure = Figure()
+        FigureCanvasAgg(fig)
+    fig.clear()
+    fig.set_size_inches(figsize)
+    _draw_panels(fig, panels, adjust)
+    output = io.BytesIO()
+    fig.savefig(output, format="png", dpi=dpi)
+    return output.getvalue()
+
+# Renderer used by the visual helpers when none is given
+renderer = show_panels
+
+def set_renderer(render):
+    "Set the default renderer of the visual helpers, e.g. png_panels in a worker."
+    global renderer
+    renderer = render
+
+def _render(panels, figsize, adjust=None, render=None):
+    return (render or renderer)(panels, figsize, adjust)
+
+def histogram(img):
+    "Count the pixels of every value (0 to 255 for 8 bits images)."
+    img = np.asarray(img)
+    if not np.issubdtype(img.dtype, np.integer):
+        return np.histogram(img, bins=256, range=(0, 256))[0]
+    return np.bincount(img.ravel(), minlength=256 if img.dtype.itemsize == 1 else 0)
+
+def plot_histogram(img, render=None):
     "Plot pixels distribution"
-    # Creating a matplotlib figure
-    fig = plt.figure(figsize=(8, 6))
-    # Plotting pixels ditribution histogram
-    # ravel() allow us to have a 1D array in order to display it on the histogram
     # Each pixel is coded on 8 bits (0 to 255 = 256 values)
-    plt.hist(img.ravel(),bins = 256, range = [0,256]) 
-    # Setting figure title and figure labels
-    plt.title('Histogram representing pixel distribution', fontsize=25)
-    plt.xlabel('Pixel value', fontsize=20)
-    plt.ylabel('Count', fontsize=20)
-    plt.show()
+    panels = [Panel('Histogram representing pixel distribution', histogram(img), "histogram", fontsize=25)]
+    return _render(panels, (8, 6), render=render)
     
-def thresholding(img, threshold=65):
+def thresholding(img, threshold=65, render=None):
     "Black or white pixels according to a given threshold"
-    # Reading the image as an array
-    img = imageio.imread(img) 
+    # Reading the image as an array if a path is given
+    img = read_image(img)
     # Converting 3D array to 2D array in order to use scipy methods
-    img = img[:,:,0]
-    # Going through all the pixels of the image
-    for x in range(img.shape[0]):
-        for y in range(img.shape[1]):
-            if img[x,y] > threshold :
-                # White pixel
-                img[x,y] = 255
-            else:
-                # Black pixel
-                img[x,y] = 0
-    # Plotting the result in a matplotlib figure
-    fig = plt.figure(figsize=(8, 6))
-    plt.imshow(img, cmap=plt.cm.gray)
-    # Setting figure title
-    plt.title('Image displayed with a threshold for the pixels', fontsize=25)
-    plt.show
+    if img.ndim == 3:
+        img = img[:,:,0]
+    img = binarize(img, threshold)
+    panels = [Panel('Image displayed with a threshold for the pixels', img, fontsize=25)]
+    return _render(panels, (8, 6), render=render)
+
+def contrasts(img):
+    "Images with different contrasts, by adjusting vmin and vmax"
+    return [
+        Panel('Original image', img),
+        Panel("Contrasted image : dark", img, vmin=10, vmax=500),
+        Panel("Contrasted image : lightened", img, vmin=10, vmax=80),
+    ]
     
-def display_images(img):
+def display_images(img, render=None):
     "Display images with different contrasts"
-    # Creating a matplotlib figure 
-    fig = plt.figure(figsize=(24,20))
-    # First subplot : Original image
-    ax1 = fig.add_subplot(131)
-    # Setting subplot title
-    ax1.title.set_text('Original image')
-    plt.imshow(img, cmap=plt.cm.gray)
-    # Constrasting image by adjusting vmin and vmax parameters
-    # Second subplot : Dark image
-    ax2 = fig.add_subplot(132)
-    ax2.title.set_text("Contrasted image : dark")
-    plt.imshow(img, cmap=plt.cm.gray, vmin=10, vmax=500)
-    # No axis
-    plt.axis('off')
-    # Third subplot : Lightened image
-    ax3 = fig.add_subplot(133)
-    ax3.title.set_text("Contrasted image : lightened")
-    plt.imshow(img, cmap=plt.cm.gray, vmin=10, vmax=80)
-    plt.axis('off')
-    plt.show()
+    return _render(contrasts(img), (24, 20), render=render)
 
-def image_manipulation(img):
+def manipulation(img):
     "Draw circles, lines into the image"
     # Reading the image as an array
-    img = imageio.imread(img) 
+    img = read_image(img).copy()
     # Converting 3D array to 2D array in order to use scipy methods
-    img = img[:,:,0]
+    if img.ndim == 3:
+        img = img[:,:,0]
     # Drawing a horizontal white line by sliccing the image
     img[100:120] = 255
     # Image shape
@@ -150,124 +348,75 @@ def image_manipulation(img):
     mask = (X - lx / 2)**2 + (Y - ly / 2)**2 > (lx / 2)**2
     # All the pixels out of the mask are forced to 0 (black)
     img[mask] = 0
-    # Plotting the result in a matplotlib figure 
-    fig = plt.figure(figsize=(10, 8))
-    plt.imshow(img, cmap=plt.cm.gray)
-    plt.title('Image manipulated with Numpy', fontsize=25)
-    plt.axis('off')
-    plt.show()
-    
-    
-def geo_transfomation(img):
+    return img
+
+def image_manipulation(img, render=None):
+    "Draw circles, lines into the image"
+    panels = [Panel('Image manipulated with Numpy', manipulation(img), fontsize=25)]
+    return _render(panels, (10, 8), render=render)
+
+def geo_transformations(img):
     "Data augmentation/Geometrical trasnformation : cropping, up flip, down flip, rotations"
     # Image shape
     lx, ly = img.shape
-    # Sliccing the image to crop it
-    crop_img = img[lx//4:-lx//4, ly//4:-ly//4]
-    # Using scipy methods to flip, rotate the image
-    flip_ud_img = np.flipud(img)
-    rotate_img = ndimage.rotate(img, 45)
-    rotate_img_noreshape = ndimage.rotate(img, 45, reshape=False)
-    # Plotting the figure in a matplotlib figure
-    fig = plt.figure(figsize=(12.5, 2.5))
-    ax1 = fig.add_subplot(151)
-    ax1.title.set_text('Original image')
-    plt.imshow(img, cmap=plt.cm.gray)
-    plt.axis('off')
-    ax2 = fig.add_subplot(152)
-    ax2.title.set_text('Image cropped')
-    plt.imshow(crop_img, cmap=plt.cm.gray)
-    plt.axis('off')
-    ax3 = fig.add_subplot(153)
-    ax3.title.set_text('Image flipped')
-    plt.imshow(flip_ud_img, cmap=plt.cm.gray)
-    plt.axis('off')
-    ax4 = fig.add_subplot(154)
-    ax4.title.set_text('Image rotated')
-    plt.imshow(rotate_img, cmap=plt.cm.gray)
-    plt.axis('off')
-    ax5 = fig.add_subplot(155)
-    ax5.title.set_text('Image rotated noreshape')
-    plt.imshow(rotate_img_noreshape, cmap=plt.cm.gray)
-    plt.axis('off')
-    plt.subplots_adjust(wspace=0.02, hspace=0.3, top=1, bottom=0.1, left=0,
-                    right=1)
-    plt.show()
+    return [
+        Panel('Original image', img),
+        # Sliccing the image to crop it
+        Panel('Image cropped', img[lx//4:-lx//4, ly//4:-ly//4]),
+        # Using scipy methods to flip, rotate the image
+        Panel('Image flipped', np.flipud(img)),
+        Panel('Image rotated', ndimage.rotate(img, 45)),
+        Panel('Image rotated noreshape', ndimage.rotate(img, 45, reshape=False)),
+    ]
+    
+def geo_transfomation(img, render=None):
+    "Data augmentation/Geometrical trasnformation : cropping, up flip, down flip, rotations"
+    adjust = dict(wspace=0.02, hspace=0.3, top=1, bottom=0.1, left=0, right=1)
+    return _render(geo_transformations(img), (12.5, 2.5), adjust, render)
+
+def blurrings(img):
+    "Use gaussian filers for blurring"
+    return [
+        # Blurring image using gaussin filters from scipy
+        Panel('Blurred image - Gaussian filter =3', blur(img, sigma=3)),
+        # With higher value of sigma
+        Panel('Very blurred image - Gaussian filter =9', blur(img, sigma=9)),
+        # Blurring image using uniform filter from scipy
+        Panel('Image with uniform filter', local_mean(img, size=11)),
+    ]
     
-def blurring(img):
+def blurring(img, render=None):
     "Use gaussian filers for blurring"
-    # Blurring image using gaussin filters from scipy
-    blurred_img = ndimage.gaussian_filter(img, sigma=3)
-    # With higher value of sigma
-    very_blurred = ndimage.gaussian_filter(img, sigma=9)
-    # Blurring image using uniform filter from scipy
-    local_mean = ndimage.uniform_filter(img, size=11)
-    # Plotting the result in a matplotlib figure
-    fig = plt.figure(figsize=(15,5))
-    ax1 = fig.add_subplot(131)
-    ax1.title.set_text('Blurred image - Gaussian filter =3')
-    plt.imshow(blurred_img, cmap=plt.cm.gray)
-    plt.axis('off')
-    ax2 = fig.add_subplot(132)
-    ax2.title.set_text('Very blurred image - Gaussian filter =9')
-    plt.imshow(very_blurred, cmap=plt.cm.gray)
-    plt.axis('off')
-    ax3= fig.add_subplot(133)
-    ax3.title.set_text('Image with uniform filter')             
-    plt.imshow(local_mean, cmap=plt.cm.gray)
-    plt.axis('off')
-    plt.subplots_adjust(wspace=0.1, hspace=0., top=0.99, bottom=0.01,
-                    left=0.01, right=0.99)
-    plt.show()
+    adjust = dict(wspace=0.1, hspace=0., top=0.99, bottom=0.01, left=0.01, right=0.99)
+    return _render(blurrings(img), (15, 5), adjust, render)
 
-def sharpenning(img,alpha=30):
+def sharpenings(img, alpha=30):
     "Sharpenning"
-    # Blurring image using gaussin filter from scipy
-    blurred_img = ndimage.gaussian_filter(img, 3)
-    # Filtering blurred image using gaussian filter
-    filter_blurred_img = ndimage.gaussian_filter(blurred_img, 1)
-    # Sharpening image a blurred image by adding a Laplacian approximation to increase the weight of the edges
-    sharpened = blurred_img + alpha * (blurred_img - filter_blurred_img)  
-    # Plotting the result in a matplotlib figure
-    fig = plt.figure(figsize=(18, 6))
-    ax1 = fig.add_subplot(131)
-    ax1.title.set_text('Original image')
-    plt.imshow(img, cmap=plt.cm.gray)
-    plt.axis('off')
-    ax2 = fig.add_subplot(132)
-    ax2.title.set_text('Blurred image - Gaussian filter =3')
-    plt.imshow(blurred_img, cmap=plt.cm.gray)
-    plt.axis('off')
-    ax3 = fig.add_subplot(133)
-    ax3.title.set_text('Blurred image sharpenned')
-    plt.imshow(sharpened, cmap=plt.cm.gray)
-    plt.axis('off')
-    plt.tight_layout()
-    plt.show()
-    
-def denoising(img):
+    return [
+        Panel('Original image', img),
+        # Blurring image using gaussin filter from scipy
+        Panel('Blurred image - Gaussian filter =3', blur(img, 3)),
+        # Sharpening image a blurred image by adding a Laplacian approximation to increase the weight of the edges
+        Panel('Blurred image sharpenned', sharpen(img, alpha)),
+    ]
+
+def sharpenning(img, alpha=30, render=None):
+    "Sharpenning"
+    return _render(sharpenings(img, alpha), (18, 6), render=render)
+
+def denoisings(img, seed=None):
     "Denoising"
     # Applying noise on the image 
-    noisy = img + 0.4*img.std()*np.random.random(img.shape)
-    # Smoothing noise and the edges using a Gaussian filter
-    gauss_denoised = ndimage.gaussian_filter(noisy, 2)
-    # Smoothing noise and the edges using a Median filter
-    med_denoised = ndimage.median_filter(noisy, 3)
-    # Plotting the result in a matplotlib figure
-    plt.figure(figsize=(18,6))
-    plt.subplot(131)
-    plt.imshow(noisy, cmap=plt.cm.gray, vmin=40, vmax=220)
-    plt.axis('off')
-    plt.title('noisy', fontsize=20)
-    plt.subplot(132)
-    plt.imshow(gauss_denoised, cmap=plt.cm.gray, vmin=40, vmax=220)
-    plt.axis('off')
-    plt.title('Gaussian filter', fontsize=20)
-    plt.subplot(133)
-    plt.imshow(med_denoised, cmap=plt.cm.gray, vmin=40, vmax=220)
-    plt.axis('off')
-    plt.title('Median filter', fontsize=20)
-    plt.subplots_adjust(wspace=0.02, hspace=0.02, top=0.9, bottom=0, left=0,
-                         right=1)
-    plt.show()
-    
\ No newline at end of file
+    noisy = add_noise(img, 0.4, seed)
+    return [
+        Panel('noisy', noisy, vmin=40, vmax=220, fontsize=20),
+        # Smoothing noise and the edges using a Gaussian filter
+        Panel('Gaussian filter', denoise(noisy, "gaussian", sigma=2), vmin=40, vmax=220, fontsize=20),
+        # Smoothing noise and the edges using a Median filter
+        Panel('Median filter', denoise(noisy, "median", size=3), vmin=40, vmax=220, fontsize=20),
+    ]
+
+def denoising(img, render=None):
+    "Denoising"
+    adjust = dict(wspace=0.02, hspace=0.02, top=0.9, bottom=0, left=0, right=1)
+    return _render(denoisings(img), (18, 6), adjust, render)
@@ -19,21 +19,130 @@
 # rsa.verify(msg2, b64decode(signature), public)
 
 
+import collections
+import concurrent.futures
+import functools
+import io
+import struct
+import threading
+import time
+
 from Crypto.PublicKey import RSA
-from Crypto.Cipher import PKCS1_OAEP
+from Crypto.Cipher import AES, PKCS1_OAEP
 from Crypto.Signature import PKCS1_v1_5
 from Crypto.Hash import SHA512, SHA384, SHA256, SHA, MD5
 from Crypto import Random
+from Crypto.Random import get_random_bytes
 from base64 import b64encode, b64decode
 
 hash = "SHA-256"
 
+# Digests by name, MD5 is used for any other name
+HASHES = {"SHA-512": SHA512, "SHA-384": SHA384, "SHA-256": SHA256, "SHA-1": SHA}
+
+# Hybrid envelope: magic, version and length of the RSA wrapped key, then the wrapped key,
+# the AES-GCM nonce, the ciphertext and the 16 bytes GCM tag
+ENVELOPE_MAGIC = b"RSAE"
+ENVELOPE_HEADER = struct.Struct(">4sBH")
+ENVELOPE_VERSION = 1
+ENVELOPE_NONCE_SIZE = 12
+ENVELOPE_TAG_SIZE = 16
+CHUNK_SIZE = 64 * 1024
+
 def newkeys(keysize):
+    #Taken from the key pool when it was started with that key size
+    if _key_pool is not None and keysize in _key_pool.sizes:
+        return _key_pool.newkeys(keysize)
     random_generator = Random.new().read
     key = RSA.generate(keysize, random_generator)
     private, public = key, key.publickey()
     return public, private
 
+def _generate_key(keysize):
+    #Runs in a worker process, the key is sent back in DER
+    return RSA.generate(keysize, Random.new().read).export_key("DER")
+
+
+class KeyPool():
+    #Keypairs generated in advance by a process pool, depth keys are kept ready for every size
+    #and the pool is refilled in the background as soon as a key is taken
+
+    def __init__(self, sizes=(2048,), depth=4, processes=None, executor=None):
+        self.sizes = tuple(sizes)
+        self.depth = depth
+        self._executor = executor or concurrent.futures.ProcessPoolExecutor(processes)
+        self._lock = threading.Lock()
+        self._keys = {size: collections.deque() for size in self.sizes}
+        self._pending = {size: 0 for size in self.sizes}
+        self._misses = {size: 0 for size in self.sizes}
+        # Time between the submission of a key generation and its availability, for the last keys
+        self._latencies = {size: collections.deque(maxlen=100) for size in self.sizes}
+        for size in self.sizes:
+            self._refill(size)
+
+    def _refill(self, keysize):
+        with self._lock:
+            missing = self.depth - len(self._keys[keysize]) - self._pending[keysize]
+            self._pending[keysize] += max(missing, 0)
+        for _ in range(missing):
+            future = self._executor.submit(_generate_key, keysize)
+            future.add_done_callback(functools.partial(self._add, keysize, time.monotonic()))
+
+    def _add(self, keysize, start, future):
+        try:
+            key = None if future.cancelled() else RSA.import_key(future.result())
+        except Exception:
+            key = None
+        with self._lock:
+            self._pending[keysize] -= 1
+            if key is not None:
+                self._keys[keysize].append(key)
+                self._latencies[keysize].append(time.monotonic() - start)
+
+    def newkeys(self, keysize):
+        with self._lock:
+            keys = self._keys[keysize]
+            key = keys.popleft() if keys else None
+            if key is None:
+                self._misses[keysize] += 1
+        self._refill(keysize)
+        if key is None:
+            # The pool is empty, generate the key synchronously
+            key = RSA.generate(keysize, Random.new().read)
+        return key.publickey(), key
+
+    def metrics(self):
+        #Depth, pending generations, empty pool misses and mean refill latency (seconds) by key size
+        with self._lock:
+            return {
+                size: {
+                    "depth": len(self._keys[size]),
+                    "pending": self._pending[size],
+                    "misses": self._misses[size],
+                    "refill_latency": sum(self._latencies[size]) / len(self._latencies[size]) if self._latencies[size] else None,
+                }
+                for size in self.sizes
+            }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+_key_pool = None
+
+def start_key_pool(sizes=(2048,), depth=4, processes=None):
+    #Make newkeys pop pre-generated keys of the given sizes
+    global _key_pool
+    stop_key_pool()
+    _key_pool = KeyPool(sizes, depth, processes)
+    return _key_pool
+
+def stop_key_pool():
+    global _key_pool
+    if _key_pool is not None:
+        _key_pool.close()
+        _key_pool = None
+
 def importKey(externKey):
     return RSA.importKey(externKey)
 
@@ -50,34 +159,124 @@ def decrypt(ciphertext, priv_key):
     cipher = PKCS1_OAEP.new(priv_key)
     return cipher.decrypt(ciphertext)
 
+def encrypt_stream(source, destination, pub_key, chunk_size=CHUNK_SIZE):
+    #Hybrid encryption: RSA-OAEP wraps a random AES-256 key, the data is encrypted with AES-GCM
+    #source and destination are binary file-like objects, the data is read by chunks
+    session_key = get_random_bytes(32)
+    wrapped_key = PKCS1_OAEP.new(pub_key).encrypt(session_key)
+    nonce = get_random_bytes(ENVELOPE_NONCE_SIZE)
+    header = ENVELOPE_HEADER.pack(ENVELOPE_MAGIC, ENVELOPE_VERSION, len(wrapped_key)) + wrapped_key + nonce
+    cipher = AES.new(session_key, AES.MODE_GCM, nonce=nonce)
+    cipher.update(header)  # The header is authenticated with the data
+    destination.write(header)
+    for chunk in iter(lambda: source.read(chunk_size), b""):
+        destination.write(cipher.encrypt(chunk))
+    destination.write(cipher.digest())
+
+def decrypt_stream(source, destination, priv_key, chunk_size=CHUNK_SIZE):
+    #Decrypt an envelope written by encrypt_stream
+    #Raises ValueError if the envelope was modified, what was written to destination must then be discarded
+    header = source.read(ENVELOPE_HEADER.size)
+    if len(header) != ENVELOPE_HEADER.size:
+        raise ValueError("Truncated envelope")
+    magic, version, key_size = ENVELOPE_HEADER.unpack(header)
+    if magic != ENVELOPE_MAGIC or version != ENVELOPE_VERSION:
+        raise ValueError("Not an envelope")
+    wrapped_key = source.read(key_size)
+    nonce = source.read(ENVELOPE_NONCE_SIZE)
+    if len(wrapped_key) != key_size or len(nonce) != ENVELOPE_NONCE_SIZE:
+        raise ValueError("Truncated envelope")
+    session_key = PKCS1_OAEP.new(priv_key).decrypt(wrapped_key)
+    cipher = AES.new(session_key, AES.MODE_GCM, nonce=nonce)
+    cipher.update(header + wrapped_key + nonce)
+    # The last bytes read are held back since they may be the tag
+    pending = b""
+    for chunk in iter(lambda: source.read(chunk_size), b""):
+        pending += chunk
+        if len(pending) > ENVELOPE_TAG_SIZE:
+            destination.write(cipher.decrypt(pending[:-ENVELOPE_TAG_SIZE]))
+            pending = pending[-ENVELOPE_TAG_SIZE:]
+    if len(pending) != ENVELOPE_TAG_SIZE:
+        raise ValueError("Truncated envelope")
+    cipher.verify(pending)
+
+def encrypt_envelope(message, pub_key):
+    #Hybrid encryption of bytes of any size, see encrypt_stream
+    output = io.BytesIO()
+    encrypt_stream(io.BytesIO(message), output, pub_key)
+    return output.getvalue()
+
+def decrypt_envelope(ciphertext, priv_key):
+    output = io.BytesIO()
+    decrypt_stream(io.BytesIO(ciphertext), output, priv_key)
+    return output.getvalue()
+
+def digest(message, hashAlg="SHA-256"):
+    #Hash the message with the digest of the given name
+    return HASHES.get(hashAlg, MD5).new(message)
+
 def sign(message, priv_key, hashAlg="SHA-256"):
     global hash
-    hash = hashAlg
+    hash = hashAlg  # Kept for verify_msg calls without hashAlg
     signer = PKCS1_v1_5.new(priv_key)
-    if (hash == "SHA-512"):
-        digest = SHA512.new()
-    elif (hash == "SHA-384"):
-        digest = SHA384.new()
-    elif (hash == "SHA-256"):
-        digest = SHA256.new()
-    elif (hash == "SHA-1"):
-        digest = SHA.new()
-    else:
-        digest = MD5.new()
-    digest.update(message)
-    return signer.sign(digest)
-
-def verify_msg(message, signature, pub_key):
+    return signer.sign(digest(message, hashAlg))
+
+def verify_msg(message, signature, pub_key, hashAlg=None):
+    #Pass hashAlg explicitly, the digest of the last sign() call is used otherwise
     signer = PKCS1_v1_5.new(pub_key)
-    if (hash == "SHA-512"):
-        digest = SHA512.new()
-    elif (hash == "SHA-384"):
-        digest = SHA384.new()
-    elif (hash == "SHA-256"):
-        digest = SHA256.new()
-    elif (hash == "SHA-1"):
-        digest = SHA.new()
-    else:
-        digest = MD5.new()
-    digest.update(message)
-    return signer.verify(digest, signature)
+    return signer.verify(digest(message, hashAlg or hash), signature)
+
+
+class KeyRing():
+    #Keys parsed once, with their cipher and signer objects cached
+    #The digest is passed on each call, so a key ring can be shared between threads
+
+    def __init__(self):
+        self._keys = {}
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, key):
+        #key is an RSA key or its PEM/DER export
+        if not isinstance(key, RSA.RsaKey):
+            key = importKey(key)
+        with self._lock:
+            self._keys[name] = key
+            self._objects = {k: v for k, v in self._objects.items() if k[0] != name}
+        return key
+
+    def key(self, name):
+        return self._keys[name]
+
+    def _get(self, name, kind, factory):
+        obj = self._objects.get((name, kind))
+        if obj is None:
+            with self._lock:
+                obj = self._objects.setdefault((name, kind), factory(self._keys[name]))
+        return obj
+
+    def cipher(self, name):
+        return self._get(name, "cipher", PKCS1_OAEP.new)
+
+    def signer(self, name):
+        return self._get(name, "signer", PKCS1_v1_5.new)
+
+    def encrypt(self, name, message):
+        return self.cipher(name).encrypt(message)
+
+    def decrypt(self, name, ciphertext):
+        return self.cipher(name).decrypt(ciphertext)
+
+    def sign(self, name, message, hashAlg="SHA-256"):
+        return self.signer(name).sign(digest(message, hashAlg))
+
+    def verify(self, name, message, signature, hashAlg="SHA-256"):
+        return self.signer(name).verify(digest(message, hashAlg), signature)
+
+    def sign_many(self, name, messages, hashAlg="SHA-256"):
+        signer = self.signer(name)
+        return [signer.sign(digest(message, hashAlg)) for message in messages]
+
+    def verify_many(self, name, messages, signatures, hashAlg="SHA-256"):
+        signer = self.signer(name)
+        return [signer.verify(digest(message, hashAlg), signature) for message, signature in zip(messages, signatures)]
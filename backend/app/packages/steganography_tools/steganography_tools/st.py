@@ -23,22 +23,134 @@ __date__ = "$Date: 2021/04/01 $"
 __revision__ = "$Date: 2021/04/01 $"
 __license__ = "GPLv3"
 
-import math
+import collections
+import functools
+import os
+import re
+import struct
 
 import numpy as np
 
+# Header of the payloads hidden with encode_bytes: magic, version and flags
+HEADER = struct.Struct(">2sBB")
+HEADER_MAGIC = b"ST"
+# The version gives the width of the length field following the header
+LENGTH_FIELDS = {1: struct.Struct(">I"), 2: struct.Struct(">Q")}
+# The flags hold the number of bits per channel used by the payload, minus one
+FLAGS_BITS_PER_CHANNEL = 0x07
+
+
+@functools.lru_cache(maxsize=None)
+def plane_schedule(bits_per_channel):
+    """
+    Return the shifts used for the successive bits of a channel and the mask of the planes
+    """
+    if not 1 <= bits_per_channel <= 8:
+        raise LSBSteganographyException("The number of bits per channel must be between 1 and 8")
+    # The first bit of a channel goes in the highest of the k planes, like a k bits number
+    shifts = tuple(range(bits_per_channel - 1, -1, -1))
+    return shifts, (1 << bits_per_channel) - 1
+
+
+def header_size(length):
+    """
+    Return the size in bytes of the header written by encode_bytes for a payload length
+    """
+    version = 1 if length < 1 << 32 else 2
+    return HEADER.size + LENGTH_FIELDS[version].size
+
+
+def capacity(shape, bits_per_channel=1):
+    """
+    Return the maximum payload in bytes that encode_bytes can hide in an image of the
+    given shape, using only the bits_per_channel lowest bit planes
+    """
+    plane_schedule(bits_per_channel)
+    height, width, nbchannels = shape
+    nbslots = height * width * nbchannels
+    # The header is always put on the first plane, one bit per channel
+    l = max(0, (nbslots - 8 * header_size(0)) * bits_per_channel // 8)
+    if l >= 1 << 32:
+        l = max((1 << 32) - 1, (nbslots - 8 * header_size(l)) * bits_per_channel // 8)
+    return l
+
+
+# Width, height and maxval of a binary PPM/PGM header, with optional comments
+PNM_FIELD = re.compile(rb"(?:\s+|#[^\r\n]*[\r\n])*(\d+)")
+
 
 class LSBSteganographyException(Exception):
     pass
 
 
+def open_carrier(path, mode="r+"):
+    """
+    Open an uncompressed image file (NPY, binary PPM/PGM or BMP) as a memory-mapped array of
+    shape (height, width, channels), so that only the rows that are used are read from the disk.
+    BMP channels are in BGR order, like cv2.imread.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        im = np.load(path, mmap_mode=mode)
+    elif ext in (".ppm", ".pgm", ".pnm"):
+        im = _open_pnm(path, mode)
+    elif ext == ".bmp":
+        im = _open_bmp(path, mode)
+    else:
+        raise LSBSteganographyException("Unsupported carrier format: %s" % ext)
+    if im.ndim == 2:
+        im = im[:, :, np.newaxis]
+    return im
+
+
+def _open_pnm(path, mode):
+    with open(path, "rb") as f:
+        head = f.read(1024)
+    magic = head[:2]
+    if magic not in (b"P5", b"P6"):
+        raise LSBSteganographyException("Only binary PPM and PGM files are supported")
+    fields = []
+    pos = 2
+    for _ in range(3):
+        match = PNM_FIELD.match(head, pos)
+        if match is None:
+            raise LSBSteganographyException("Invalid PPM/PGM header")
+        fields.append(int(match.group(1)))
+        pos = match.end()
+    width, height, maxval = fields
+    dtype = np.uint8 if maxval < 256 else np.dtype(">u2")  # 16 bits samples are big endian
+    nbchannels = 3 if magic == b"P6" else 1
+    # A single whitespace separates the header from the raster
+    return np.memmap(path, dtype=dtype, mode=mode, offset=pos + 1, shape=(height, width, nbchannels))
+
+
+def _open_bmp(path, mode):
+    with open(path, "rb") as f:
+        head = f.read(54)
+    if head[:2] != b"BM":
+        raise LSBSteganographyException("Invalid BMP header")
+    offset, = struct.unpack_from("<I", head, 10)
+    width, height, _, bpp, compression = struct.unpack_from("<iiHHI", head, 18)
+    if bpp not in (24, 32) or compression != 0:
+        raise LSBSteganographyException("Only uncompressed 24 and 32 bits BMP files are supported")
+    nbchannels = bpp // 8
+    stride = (width * nbchannels + 3) & ~3  # Rows are padded to 4 bytes
+    rows = np.memmap(path, dtype=np.uint8, mode=mode, offset=offset, shape=(abs(height), stride))
+    im = rows[:, :width * nbchannels].reshape(abs(height), width, nbchannels)
+    if height > 0:  # Rows are stored bottom-up
+        im = im[::-1]
+    return im
+
+
 class LSBSteganography():
     """
     Main class to handle Steganography encrypted data.
     """
 
-    def __init__(self, im):
+    def __init__(self, im, stripe_rows=None):
         self.image = im
+        # Number of rows processed at once, to bound the memory used on large memory-mapped carriers
+        self.stripe_rows = stripe_rows
         # Save the image height, width and the number of channels
         self.height, self.width, self.nbchannels = im.shape
         self.size = self.width * self.height
@@ -78,6 +190,59 @@ class LSBSteganography():
             self.image[self.curheight,self.curwidth] = tuple(val)  
             self.next_slot()  # Move "cursor" to the next space
         
+    def put_bit_array(self, bits):
+        """
+        Put an array of bits (0/1 values) in the image, one masked operation per bit plane
+        """
+        bits = np.asarray(bits, dtype=np.uint8).ravel()
+        nbslots = self.size * self.nbchannels
+        start = self._cursor()
+        end = start + bits.size
+        self._check_slots(bits.size)
+        keep = np.iinfo(self.image.dtype).max
+        done = 0
+        while done < bits.size:
+            # The slots of a plane are walked in (height, width, channel) order like next_slot
+            plane, lo = divmod(start + done, nbslots)
+            hi = min(nbslots, lo + bits.size - done)
+            for chunk, offset in self._stripes(lo, hi):
+                chunk &= keep ^ (1 << plane)  # AND with maskZERO
+                chunk |= bits[done + offset:done + offset + chunk.size] << plane  # OR with maskONE where the bit is 1
+            done += hi - lo
+        self._seek(end)
+
+    def _stripes(self, lo, hi, write=True):
+        """
+        Yield the flat slots lo to hi of a plane by stripes of rows, with the offset of each
+        stripe from lo. The changes made to a stripe are written back to the image.
+        Only the slots lo to hi are read, whatever the memory layout of the image.
+        """
+        rowlen = self.width * self.nbchannels
+        rows = self.stripe_rows or self.height
+        row = lo // rowlen
+        while row * rowlen < hi:
+            block = self.image[row:row + rows]
+            first = row * rowlen
+            a = max(lo, first) - first
+            b = min(hi, first + block.size) - first
+            if block.flags.c_contiguous:
+                yield block.reshape(-1)[a:b], a + first - lo
+            else:
+                # Gather exactly the slots with fancy indexing instead of copying the stripe
+                index = np.unravel_index(np.arange(a, b), block.shape)
+                values = block[index]
+                yield values, a + first - lo
+                if write:
+                    block[index] = values
+            row += rows
+
+    def flush(self):
+        """
+        Write the changes made to a memory-mapped carrier to the disk
+        """
+        if isinstance(self.image, np.memmap):
+            self.image.flush()
+
     def next_slot(self):
         """
         Move to the next slot were information can be taken or put
@@ -100,6 +265,83 @@ class LSBSteganography():
         else:
             self.curchan +=1
 
+    def _cursor(self):
+        """
+        Return the cursor position as a linear slot index over all the bit planes
+        """
+        plane = self.maskONE.bit_length() - 1
+        pos = (self.curheight * self.width + self.curwidth) * self.nbchannels + self.curchan
+        return plane * self.size * self.nbchannels + pos
+
+    def _seek(self, slot):
+        """
+        Move the cursor to the given linear slot index
+        """
+        plane, pos = divmod(slot, self.size * self.nbchannels)
+        pos, self.curchan = divmod(pos, self.nbchannels)
+        self.curheight, self.curwidth = divmod(pos, self.width)
+        self.maskONEValues = [1 << p for p in range(plane, 8)]
+        self.maskONE = self.maskONEValues.pop(0)
+        self.maskZEROValues = [255 - m for m in self.maskONEValues]
+        self.maskZERO = 255 - self.maskONE
+
+    def put_plane_array(self, bits, bits_per_channel):
+        """
+        Put an array of bits in the bits_per_channel lowest planes of the channels following
+        the cursor, in a single vectorized pass
+        """
+        shifts, planes = plane_schedule(bits_per_channel)
+        bits = np.asarray(bits, dtype=np.uint8).ravel()
+        start = self._cursor()
+        nb = -(-bits.size // bits_per_channel)  # Number of channels used
+        self._check_planes(nb)
+        groups = np.zeros(nb * bits_per_channel, dtype=np.uint8)
+        groups[:bits.size] = bits  # The last channel is padded with zeros
+        groups = groups.reshape(nb, bits_per_channel)
+        values = np.zeros(nb, dtype=np.uint8)
+        for i, shift in enumerate(shifts):
+            values |= groups[:, i] << shift
+        keep = np.iinfo(self.image.dtype).max
+        for chunk, offset in self._stripes(start, start + nb):
+            chunk &= keep ^ planes
+            chunk |= values[offset:offset + chunk.size]
+        self._seek(start + nb)
+
+    def read_plane_array(self, nb, bits_per_channel):
+        """
+        Read nb bits from the bits_per_channel lowest planes of the channels following the cursor
+        """
+        shifts, planes = plane_schedule(bits_per_channel)
+        start = self._cursor()
+        nbchan = -(-nb // bits_per_channel)
+        self._check_planes(nbchan)
+        bits = np.empty((nbchan, bits_per_channel), dtype=np.uint8)
+        for chunk, offset in self._stripes(start, start + nbchan, write=False):
+            for i, shift in enumerate(shifts):
+                bits[offset:offset + chunk.size, i] = (chunk >> shift) & 1
+        self._seek(start + nbchan)
+        return bits.reshape(-1)[:nb]
+
+    def _check_planes(self, nb):
+        """
+        Check that nb channels remain on the first plane after the cursor
+        """
+        if self._cursor() + nb > self.size * self.nbchannels:
+            raise LSBSteganographyException("No available slot remaining (image filled)")
+
+    def capacity(self, bits_per_channel=1):
+        """
+        Return the maximum payload in bytes that encode_bytes can hide in the image
+        """
+        return capacity(self.image.shape, bits_per_channel)
+
+    def _check_slots(self, nb):
+        """
+        Check that nb bits can be put or read from the cursor position
+        """
+        if self._cursor() + nb >= 8 * self.size * self.nbchannels:
+            raise LSBSteganographyException("No available slot remaining (image filled)")
+
     def read_bit(self): 
         """
         Read a single bit int the image
@@ -119,9 +361,26 @@ class LSBSteganography():
         """
         Read the given number of bits
         """
-        bits = ""
-        for i in range(nb):
-            bits += self.read_bit()
+        bits = self.read_bit_array(nb) + ord("0")  # ASCII "0" or "1"
+        return bits.tobytes().decode("ascii")
+
+    def read_bit_array(self, nb):
+        """
+        Read the given number of bits as an array of 0/1 values
+        """
+        nbslots = self.size * self.nbchannels
+        start = self._cursor()
+        end = start + nb
+        self._check_slots(nb)
+        bits = np.empty(nb, dtype=np.uint8)
+        done = 0
+        while done < nb:
+            plane, lo = divmod(start + done, nbslots)
+            hi = min(nbslots, lo + nb - done)
+            for chunk, offset in self._stripes(lo, hi, write=False):
+                bits[done + offset:done + offset + chunk.size] = (chunk >> plane) & 1
+            done += hi - lo
+        self._seek(end)
         return bits
 
     def byteValue(self, val):
@@ -136,48 +395,183 @@ class LSBSteganography():
         binval = bin(val)[2:]  # Assign the binary value without the prefix
         if len(binval) > bitsize:
             raise LSBSteganographyException("binary value larger than the expected size")
-        while len(binval) < bitsize:  # Add zeros until we reach the bitsize
-            binval = "0"+binval
-        return binval
+        return binval.rjust(bitsize, "0")  # Add zeros until we reach the bitsize
 
     def encode_text(self, txt):
         l = len(txt)
-        binl = self.binary_value(l, 16)  # Length coded on 2 bytes so the text size can be up to 65536 bytes long
-        self.put_binary_value(binl)  # Put text length encoded in the image
-        for char in txt:  # And put all the chars
-            # Returns the number representing the unicode code of a specified character
-            c = ord(char)
-            self.put_binary_value(self.byteValue(c))
+        if l >= 1 << 16:  # Length coded on 2 bytes so the text size can be up to 65535 bytes long
+            raise LSBSteganographyException("binary value larger than the expected size")
+        try:
+            # Every char is coded on a single byte
+            data = txt.encode("latin-1")
+        except UnicodeEncodeError:
+            raise LSBSteganographyException("binary value larger than the expected size")
+        payload = np.frombuffer(bytes([l >> 8, l & 255]) + data, dtype=np.uint8)
+        self.put_bit_array(np.unpackbits(payload))  # Put text length and all the chars in the image
         return self.image
        
     def decode_text(self):
-        ls = self.read_bits(16)  # Read the text size in bytes
-        l = int(ls,2)
-        i = 0
-        unhideTxt = ""
-        while i < l:  # Read all bytes of the text
-            tmp = self.read_byte()  # So one byte
-            i += 1
-            unhideTxt += chr(int(tmp,2))  # Every chars concatenated to str
-        return unhideTxt
+        ls = np.packbits(self.read_bit_array(16))  # Read the text size in bytes
+        l = (int(ls[0]) << 8) | int(ls[1])
+        # Only the slots holding the text are read, nothing after them
+        unhideTxt = np.packbits(self.read_bit_array(8 * l)).tobytes()  # Read all bytes of the text
+        return unhideTxt.decode("latin-1")
+
+    def encode_bytes(self, data, bits_per_channel=1):
+        """
+        Hide bytes (or any buffer such as a memoryview) behind a versioned header.
+        The payload is put in the bits_per_channel lowest bits of every channel, it never
+        goes on with the next plane once the image is filled, see capacity.
+        """
+        plane_schedule(bits_per_channel)
+        payload = np.frombuffer(data, dtype=np.uint8)
+        l = payload.size
+        version = 1 if l < 1 << 32 else 2  # Length coded on 4 bytes, or on 8 bytes for larger payloads
+        flags = bits_per_channel - 1
+        header = HEADER.pack(HEADER_MAGIC, version, flags) + LENGTH_FIELDS[version].pack(l)
+        # Nothing is written when the payload does not fit in the bits_per_channel lowest planes
+        self._check_planes(8 * len(header) + -(-8 * l // bits_per_channel))
+        self.put_bit_array(np.unpackbits(np.frombuffer(header, dtype=np.uint8)))
+        self.put_plane_array(np.unpackbits(payload), bits_per_channel)
+        return self.image
+
+    def decode_bytes(self):
+        """
+        Recover the bytes hidden with encode_bytes
+        """
+        header = np.packbits(self.read_bit_array(8 * HEADER.size)).tobytes()
+        magic, version, flags = HEADER.unpack(header)
+        if magic != HEADER_MAGIC or version not in LENGTH_FIELDS:
+            raise LSBSteganographyException("No hidden data found in the image")
+        length_field = LENGTH_FIELDS[version]
+        l, = length_field.unpack(np.packbits(self.read_bit_array(8 * length_field.size)).tobytes())
+        bits_per_channel = (flags & FLAGS_BITS_PER_CHANNEL) + 1
+        if bits_per_channel == 1:
+            # Payloads hidden by the previous versions may go on with the next planes
+            return np.packbits(self.read_bit_array(8 * l)).tobytes()
+        return np.packbits(self.read_plane_array(8 * l, bits_per_channel)).tobytes()
+
+
+# Metrics computed by Compare, per image of the batch or per image and channel.
+# mse is the mean squared error per sample, summed_mse the squared error summed over
+# the channels and averaged over the pixels, as returned by Compare.meanSquareError.
+CompareResults = collections.namedtuple(
+    "CompareResults",
+    [
+        "mse",
+        "psnr",
+        "ssim",
+        "channel_mse",
+        "channel_max_error",
+        "channel_mean_error",
+        "summed_mse",
+        "summed_psnr",
+    ],
+)
 
 
 class Compare():
+    """
+    Compare original and encoded images: a single pair of (height, width[, channels]) images
+    or a batch of them stacked as (n, height, width, channels).
+    """
+
+    # Constants of the SSIM for 8 bits images
+    SSIM_C1 = (0.01 * 255) ** 2
+    SSIM_C2 = (0.03 * 255) ** 2
+
     def __init__(self, img1, img2):
         self.img1 = img1
         self.img2 = img2
+        self._results = None
+
+    def _batch(self, img):
+        """
+        Return the image as a (n, height, width, channels) stack
+        """
+        img = np.asarray(img)
+        if img.ndim == 2:
+            img = img[:, :, np.newaxis]
+        if img.ndim == 3:
+            img = img[np.newaxis]
+        return img
+
+    def results(self):
+        """
+        Compute all the metrics in a single pass over each pair of images.
+        The MSE is the mean over the pixels and the channels of the squared error.
+        The SSIM is a global SSIM, computed on the whole image taken as a single window,
+        not the usual mean of the SSIM over 11x11 gaussian windows.
+        """
+        if self._results is not None:
+            return self._results
+        batch1, batch2 = self._batch(self.img1), self._batch(self.img2)
+        if batch1.shape != batch2.shape:
+            raise ValueError("Images must have the same shape")
+        n, height, width, nbchannels = batch1.shape
+        if batch1.dtype.itemsize == 1:  # 8 bits samples: differences fit on int16, squares on int32
+            diff_dtype, square_dtype, sum_dtype = np.int16, np.int32, np.int64
+        else:
+            diff_dtype, square_dtype, sum_dtype = np.float64, np.float64, np.float64
+        diff = np.empty((height, width, nbchannels), dtype=diff_dtype)
+        square = np.empty((height, width, nbchannels), dtype=square_dtype)
+        # Per image and channel sums: error, absolute max error, squared error, x, y, x^2, y^2
+        sums = np.empty((7, n, nbchannels), dtype=np.float64)
+        for i in range(n):
+            np.subtract(batch1[i], batch2[i], out=diff, dtype=diff_dtype)
+            sums[0, i] = diff.sum(axis=(0, 1), dtype=sum_dtype)
+            sums[1, i] = np.abs(diff).max(axis=(0, 1))
+            np.multiply(diff, diff, out=square, dtype=square_dtype)
+            sums[2, i] = square.sum(axis=(0, 1), dtype=sum_dtype)
+            sums[3, i] = batch1[i].sum(axis=(0, 1), dtype=sum_dtype)
+            sums[4, i] = batch2[i].sum(axis=(0, 1), dtype=sum_dtype)
+            np.multiply(batch1[i], batch1[i], out=square, dtype=square_dtype)
+            sums[5, i] = square.sum(axis=(0, 1), dtype=sum_dtype)
+            np.multiply(batch2[i], batch2[i], out=square, dtype=square_dtype)
+            sums[6, i] = square.sum(axis=(0, 1), dtype=sum_dtype)
+        npixels = height * width
+        error, max_error, squared, x, y, x2, y2 = sums
+        channel_mse = squared / npixels
+        mse = channel_mse.mean(axis=1)
+        summed_mse = channel_mse.sum(axis=1)
+        with np.errstate(divide="ignore"):
+            psnr = np.where(mse == 0, 100.0, 10 * np.log10(255.0 ** 2 / mse))
+            summed_psnr = np.where(summed_mse == 0, 100.0, 10 * np.log10(255.0 ** 2 / summed_mse))
+        # x.y is deduced from (x - y)^2 = x^2 + y^2 - 2x.y
+        xy = (x2 + y2 - squared) / 2
+        mean_x, mean_y = x / npixels, y / npixels
+        var_x = x2 / npixels - mean_x ** 2
+        var_y = y2 / npixels - mean_y ** 2
+        cov = xy / npixels - mean_x * mean_y
+        ssim = ((2 * mean_x * mean_y + self.SSIM_C1) * (2 * cov + self.SSIM_C2)) / (
+            (mean_x ** 2 + mean_y ** 2 + self.SSIM_C1) * (var_x + var_y + self.SSIM_C2)
+        )
+        self._results = CompareResults(
+            mse=mse,
+            psnr=psnr,
+            ssim=ssim.mean(axis=1),
+            channel_mse=channel_mse,
+            channel_max_error=max_error,
+            channel_mean_error=error / npixels,
+            summed_mse=summed_mse,
+            summed_psnr=summed_psnr,
+        )
+        if np.ndim(self.img1) < 4:  # A single pair of images
+            self._results = CompareResults(*(field[0] for field in self._results))
+        return self._results
+
     def get_results(self):
-        print("meanSquareError: %s" %(self.meanSquareError()))
-        print("psnr: %s" %(self.psnr()))
+        return self.results()
+
     def correlation(self):
+        from scipy import signal
+
         return signal.correlate2d (self.img1, self.img2)
+
     def meanSquareError(self):
-        error = np.sum((self.img1.astype('float') - self.img2.astype('float')) ** 2)
-        error /= float(self.img1.shape[0] * self.img1.shape[1]);
-        return error
+        # Squared error summed over the channels, divided by the number of pixels
+        return self.results().summed_mse
+
     def psnr(self):
-        mse = self.meanSquareError()
-        if mse == 0:
-            return 100
-        PIXEL_MAX = 255.0
-        return 20 * math.log10(PIXEL_MAX / math.sqrt(mse))
+        # PSNR of the summed squared error, not of the per sample mse of results()
+        return self.results().summed_psnr
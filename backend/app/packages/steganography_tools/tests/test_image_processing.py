@@ -0,0 +1,175 @@
+import functools
+
+import numpy as np
+import pytest
+
+image_processing = pytest.importorskip("steganography_tools.image_processing")
+
+
+def random_image(height=30, width=40, seed=0):
+    return np.random.RandomState(seed).randint(0, 256, (height, width, 3)).astype(np.uint8)
+
+
+def test_grayscale_matches_pil():
+    from PIL import Image
+
+    rgb = random_image()
+    expected = np.asarray(Image.fromarray(rgb).convert("L"))
+    assert np.array_equal(image_processing.grayscale(rgb), expected)
+
+
+def test_binarize():
+    gray = random_image()[:, :, 0]
+    out = np.empty_like(gray)
+    result = image_processing.binarize(gray, 65, out=out)
+    assert result is out
+    assert np.array_equal(result, np.where(gray > 65, 255, 0))
+
+
+def test_compose():
+    rgb = random_image()
+    pipeline = image_processing.compose(
+        image_processing.grayscale,
+        functools.partial(image_processing.blur, sigma=2),
+        functools.partial(image_processing.binarize, threshold=100),
+    )
+    out = np.empty(rgb.shape[:2], dtype=np.uint8)
+    assert pipeline(rgb, out=out) is out
+    expected = image_processing.binarize(image_processing.blur(image_processing.grayscale(rgb), 2), 100)
+    assert np.array_equal(out, expected)
+
+
+def test_sharpen_stays_in_range():
+    # A sharp edge overshoots on both sides
+    gray = np.zeros((30, 40), dtype=np.uint8)
+    gray[:, 20:] = 255
+    sharpened = image_processing.sharpen(gray, alpha=30)
+    assert sharpened.dtype == np.uint8
+    assert sharpened[:, 17] == pytest.approx(0) and sharpened[:, 22] == pytest.approx(255)
+
+
+def test_filters_keep_channels_apart():
+    # A pure red image stays pure red
+    red = np.zeros((30, 40, 3), dtype=np.uint8)
+    red[:, :, 0] = 255
+    for stage in [
+        image_processing.blur,
+        image_processing.local_mean,
+        image_processing.sharpen,
+        image_processing.denoise,
+        functools.partial(image_processing.denoise, method="gaussian"),
+    ]:
+        assert np.array_equal(stage(red), red)
+    # Each channel is filtered like a grayscale image
+    rgb = random_image()
+    blurred = image_processing.blur(rgb, 2)
+    denoised = image_processing.denoise(rgb)
+    for channel in range(3):
+        assert np.array_equal(blurred[:, :, channel], image_processing.blur(rgb[:, :, channel], 2))
+        assert np.array_equal(denoised[:, :, channel], image_processing.denoise(rgb[:, :, channel]))
+
+
+def test_read_metadata(tmp_path):
+    from PIL import Image
+
+    path = str(tmp_path / "image.jpg")
+    exif = Image.Exif()
+    exif[0x010E] = "description"  # ImageDescription
+    Image.fromarray(random_image()).save(path, exif=exif)
+    metadata = image_processing.read_metadata(path)
+    assert metadata.format == "JPEG"
+    assert metadata.mode == "RGB"
+    assert metadata.size == (40, 30)
+    assert metadata.palette is None
+    assert metadata.exif["ImageDescription"] == "description"
+    assert image_processing.get_metadata(path) == {"ImageDescription": "description"}
+    # Memoized by content
+    with open(path, "rb") as f:
+        assert image_processing.read_metadata(f.read()) is metadata
+
+
+def test_read_metadata_exif_ifd(tmp_path):
+    from PIL import Image
+
+    path = str(tmp_path / "camera.jpg")
+    exif = Image.Exif()
+    exif[0x010F] = "Canon"  # Make
+    exif.get_ifd(0x8769)[0x9003] = "2016:05:05 13:04:42"  # DateTimeOriginal
+    exif.get_ifd(0x8769)[0x829A] = 0.005  # ExposureTime
+    exif.get_ifd(0x8825)[0x0001] = "N"  # GPSLatitudeRef
+    Image.fromarray(random_image()).save(path, exif=exif)
+    with Image.open(path) as image:
+        # The tags returned by the previous versions
+        expected = image._getexif()
+    metadata = image_processing.get_metadata(path)
+    assert metadata["Make"] == "Canon"
+    assert metadata["DateTimeOriginal"] == "2016:05:05 13:04:42"
+    assert metadata["ExposureTime"] == pytest.approx(0.005)
+    assert metadata["GPSInfo"] == {1: "N"}
+    assert len(metadata) == len(expected)
+
+
+def test_read_metadata_png_headers_only(monkeypatch):
+    from PIL import Image, ImageFile
+    import io
+
+    def load(self):
+        raise AssertionError("The pixels are decoded")
+
+    exif = Image.Exif()
+    exif[0x010F] = "Canon"  # Make
+    exif.get_ifd(0x8769)[0x9003] = "2016:05:05 13:04:42"  # DateTimeOriginal
+    images = []
+    for seed, options in enumerate([{}, {"exif": exif}]):
+        output = io.BytesIO()
+        Image.fromarray(random_image(seed=seed)).save(output, "PNG", **options)
+        images.append(output.getvalue())
+    monkeypatch.setattr(ImageFile.ImageFile, "load", load)
+    without_exif, with_exif = [image_processing.read_metadata(image) for image in images]
+    assert without_exif.format == "PNG" and without_exif.size == (40, 30)
+    assert dict(without_exif.exif) == {}
+    assert with_exif.exif["Make"] == "Canon"
+    assert with_exif.exif["DateTimeOriginal"] == "2016:05:05 13:04:42"
+
+
+def test_read_metadata_cache_is_bounded(monkeypatch):
+    from PIL import Image
+    import io
+
+    monkeypatch.setattr(image_processing, "METADATA_CACHE_SIZE", 2)
+    images = []
+    for seed in range(3):
+        output = io.BytesIO()
+        Image.fromarray(random_image(seed=seed)).convert("P").save(output, "PNG")
+        images.append(output.getvalue())
+    first = image_processing.read_metadata(images[0])
+    assert first.mode == "P" and first.palette is not None
+    image_processing.read_metadata(images[1])
+    image_processing.read_metadata(images[2])
+    assert len(image_processing._metadata_cache) == 2
+    assert image_processing.read_metadata(images[0]) is not first
+
+
+def test_histogram():
+    gray = random_image()[:, :, 0]
+    expected, _ = np.histogram(gray, bins=256, range=(0, 256))
+    assert np.array_equal(image_processing.histogram(gray), expected)
+
+
+def test_png_panels_from_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    gray = random_image(64, 64)[:, :, 0]
+    helpers = [
+        image_processing.plot_histogram,
+        image_processing.display_images,
+        image_processing.geo_transfomation,
+        image_processing.blurring,
+        image_processing.sharpenning,
+        image_processing.denoising,
+    ]
+    with ThreadPoolExecutor(4) as executor:
+        renders = list(executor.map(lambda helper: helper(gray, render=image_processing.png_panels), helpers * 2))
+    for png in renders:
+        assert png.startswith(b"\x89PNG\r\n\x1a\n")
+    assert renders[0] == renders[len(helpers)]
@@ -0,0 +1,80 @@
+import io
+
+import pytest
+
+from steganography_tools import rsa_text_encoding
+
+
+@pytest.fixture(scope="module")
+def keys():
+    return rsa_text_encoding.newkeys(1024)
+
+
+def test_envelope(keys):
+    public, private = keys
+    for message in [b"", b"Hello World!", bytes(range(256)) * 4000]:
+        envelope = rsa_text_encoding.encrypt_envelope(message, public)
+        assert rsa_text_encoding.decrypt_envelope(envelope, private) == message
+
+
+def test_envelope_stream(keys):
+    public, private = keys
+    message = b"x" * 100001
+    encrypted = io.BytesIO()
+    rsa_text_encoding.encrypt_stream(io.BytesIO(message), encrypted, public, chunk_size=1000)
+    encrypted.seek(0)
+    decrypted = io.BytesIO()
+    rsa_text_encoding.decrypt_stream(encrypted, decrypted, private, chunk_size=777)
+    assert decrypted.getvalue() == message
+
+
+def test_modified_envelope(keys):
+    public, private = keys
+    envelope = bytearray(rsa_text_encoding.encrypt_envelope(b"Hello World!", public))
+    envelope[-20] ^= 1
+    with pytest.raises(ValueError):
+        rsa_text_encoding.decrypt_envelope(bytes(envelope), private)
+    with pytest.raises(ValueError):
+        rsa_text_encoding.decrypt_envelope(bytes(envelope[:-1]), private)
+
+
+def test_sign_and_verify_with_explicit_digest(keys):
+    public, private = keys
+    signature = rsa_text_encoding.sign(b"message", private, "SHA-512")
+    rsa_text_encoding.sign(b"other", private, "SHA-1")
+    assert rsa_text_encoding.verify_msg(b"message", signature, public, "SHA-512")
+    assert not rsa_text_encoding.verify_msg(b"message", signature, public, "SHA-256")
+
+
+def test_key_ring(keys):
+    public, private = keys
+    ring = rsa_text_encoding.KeyRing()
+    ring.add("private", private.exportKey("PEM"))
+    ring.add("public", public)
+    assert ring.signer("private") is ring.signer("private")
+    assert ring.decrypt("private", ring.encrypt("public", b"secret")) == b"secret"
+    messages = [b"message %d" % i for i in range(20)]
+    signatures = ring.sign_many("private", messages, "SHA-384")
+    assert signatures[3] == rsa_text_encoding.sign(messages[3], private, "SHA-384")
+    assert all(ring.verify_many("public", messages, signatures, "SHA-384"))
+    assert ring.verify_many("public", messages[1:], signatures[:-1], "SHA-384") == [False] * 19
+    assert ring.verify("public", messages[0], signatures[0], "SHA-384")
+
+
+def test_key_pool():
+    import time
+
+    pool = rsa_text_encoding.start_key_pool(sizes=(1024,), depth=2, processes=2)
+    try:
+        deadline = time.monotonic() + 60
+        while pool.metrics()[1024]["depth"] < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        metrics = pool.metrics()[1024]
+        assert metrics["depth"] == 2 and metrics["refill_latency"] > 0
+        public, private = rsa_text_encoding.newkeys(1024)
+        assert private.size_in_bits() == 1024 and public == private.publickey()
+        assert pool.metrics()[1024]["misses"] == 0
+        # Sizes outside the pool are generated directly
+        assert rsa_text_encoding.newkeys(1536)[1].size_in_bits() == 1536
+    finally:
+        rsa_text_encoding.stop_key_pool()
@@ -0,0 +1,199 @@
+import numpy as np
+import pytest
+
+from steganography_tools import st
+
+
+def random_image(height=7, width=5, nbchannels=3, seed=0):
+    return np.random.RandomState(seed).randint(0, 256, (height, width, nbchannels)).astype(np.uint8)
+
+
+def legacy_encode_text(im, txt):
+    # Bit by bit reference implementation through the cursor
+    steg = st.LSBSteganography(im)
+    steg.put_binary_value(steg.binary_value(len(txt), 16))
+    for char in txt:
+        steg.put_binary_value(steg.byteValue(ord(char)))
+    return steg.image
+
+
+def test_encode_text_matches_cursor_layout():
+    # 16 + 12 * 8 bits do not fit in the 105 slots of the first plane
+    for txt in ["", "a", "Hello World!", "\xe9t\xe9"]:
+        expected = legacy_encode_text(random_image(), txt)
+        encoded = st.LSBSteganography(random_image()).encode_text(txt)
+        assert np.array_equal(encoded, expected)
+
+
+def test_encode_and_decode_text():
+    encoded = st.LSBSteganography(random_image()).encode_text("Hello World!")
+    assert st.LSBSteganography(encoded).decode_text() == "Hello World!"
+
+
+def test_cursor_is_kept_after_bulk_write():
+    steg = st.LSBSteganography(random_image())
+    steg.put_bit_array(np.ones(110, dtype=np.uint8))
+    assert (steg.curheight, steg.curwidth, steg.curchan) == (0, 1, 2)
+    assert (steg.maskONE, steg.maskZERO) == (2, 253)
+
+
+def test_encode_text_in_non_contiguous_image():
+    image = np.asfortranarray(random_image())
+    expected = legacy_encode_text(random_image(), "foo")
+    assert np.array_equal(st.LSBSteganography(image).encode_text("foo"), expected)
+    assert np.array_equal(image, expected)
+
+
+def test_encode_text_with_image_filled():
+    with pytest.raises(st.LSBSteganographyException):
+        st.LSBSteganography(random_image(2, 2, 3)).encode_text("Hello World!")
+
+
+def test_encode_and_decode_bytes():
+    for data in [b"", b"\x00\xff" * 20, "I love 🍕".encode("utf-8")]:
+        encoded = st.LSBSteganography(random_image(20, 20)).encode_bytes(data)
+        assert st.LSBSteganography(encoded).decode_bytes() == data
+
+
+def test_encode_bytes_from_memoryview():
+    data = memoryview(bytearray(range(256)))
+    encoded = st.LSBSteganography(random_image(40, 40)).encode_bytes(data)
+    assert st.LSBSteganography(encoded).decode_bytes() == bytes(data)
+
+
+def test_encode_bytes_header():
+    encoded = st.LSBSteganography(random_image()).encode_bytes(b"a")
+    header = np.packbits(encoded.reshape(-1)[:64] & 1).tobytes()
+    assert header == st.HEADER_MAGIC + b"\x01\x00" + b"\x00\x00\x00\x01"
+
+
+def test_decode_bytes_without_hidden_data():
+    with pytest.raises(st.LSBSteganographyException):
+        st.LSBSteganography(np.zeros((10, 10, 3), dtype=np.uint8)).decode_bytes()
+
+
+def test_encode_bytes_with_image_filled():
+    image = random_image()
+    with pytest.raises(st.LSBSteganographyException):
+        st.LSBSteganography(image).encode_bytes(b"x" * 200)
+    assert np.array_equal(image, random_image())
+
+
+def test_encode_and_decode_bytes_with_bits_per_channel():
+    data = bytes(range(256))
+    for bits_per_channel in [2, 3, 8]:
+        image = random_image(30, 30)
+        encoded = st.LSBSteganography(image.copy()).encode_bytes(data, bits_per_channel)
+        assert st.LSBSteganography(encoded).decode_bytes() == data
+        # Only the k lowest planes are changed
+        high = 255 ^ ((1 << bits_per_channel) - 1)
+        assert np.array_equal(encoded & high, image & high)
+
+
+def test_capacity():
+    image = random_image(20, 20)
+    steg = st.LSBSteganography(image)
+    assert steg.capacity() == (1200 - 64) // 8
+    assert steg.capacity(3) == (1200 - 64) * 3 // 8
+    assert st.capacity((4000, 6000, 3), 2) == (72000000 - 64) * 2 // 8
+    for bits_per_channel in [1, 2, 3]:
+        l = steg.capacity(bits_per_channel)
+        encoded = st.LSBSteganography(image.copy()).encode_bytes(b"x" * l, bits_per_channel)
+        # Only the k lowest planes are changed
+        high = 255 ^ ((1 << bits_per_channel) - 1)
+        assert np.array_equal(encoded & high, image & high)
+        with pytest.raises(st.LSBSteganographyException):
+            st.LSBSteganography(image.copy()).encode_bytes(b"x" * (l + 1), bits_per_channel)
+
+
+def test_invalid_bits_per_channel():
+    with pytest.raises(st.LSBSteganographyException):
+        st.LSBSteganography(random_image()).encode_bytes(b"a", 9)
+
+
+
+def test_encode_by_stripes_matches_whole_image():
+    # 8 + 100 bytes fill the first plane of the 900 slots
+    data = bytes(range(100))
+    expected = st.LSBSteganography(random_image(30, 10)[::-1]).encode_bytes(data)
+    for stripe_rows in [1, 4, 7]:
+        # Rows in reverse order, like a bottom-up BMP
+        image = random_image(30, 10)[::-1]
+        encoded = st.LSBSteganography(image, stripe_rows).encode_bytes(data)
+        assert np.array_equal(encoded, expected)
+        assert st.LSBSteganography(image, stripe_rows).decode_bytes() == data
+
+
+def test_encode_in_carrier_files(tmp_path):
+    from PIL import Image
+
+    data = b"Hello World!" * 10
+    rgb = random_image(40, 30)
+    carriers = {"carrier.npy": rgb, "carrier.ppm": rgb, "carrier.bmp": rgb[:, :, ::-1]}
+    for name, expected in carriers.items():
+        path = str(tmp_path / name)
+        if name.endswith(".npy"):
+            np.save(path, rgb)
+        else:
+            Image.fromarray(rgb).save(path)
+        carrier = st.open_carrier(path)
+        assert np.array_equal(carrier, expected)
+        steg = st.LSBSteganography(carrier, stripe_rows=8)
+        steg.encode_bytes(data, bits_per_channel=2)
+        steg.flush()
+        del steg, carrier
+        if name.endswith(".npy"):
+            saved = np.load(path)
+        else:
+            saved = np.asarray(Image.open(path))
+        assert not np.array_equal(saved, rgb)
+        assert st.LSBSteganography(st.open_carrier(path, mode="r")).decode_bytes() == data
+
+
+def test_decode_text_in_non_contiguous_image():
+    encoded = st.LSBSteganography(random_image()).encode_text("Hello World!")
+    for stripe_rows in [None, 2]:
+        image = np.asfortranarray(encoded)
+        assert st.LSBSteganography(image, stripe_rows).decode_text() == "Hello World!"
+
+
+def test_read_bits():
+    encoded = st.LSBSteganography(random_image()).encode_text("a")
+    steg = st.LSBSteganography(encoded)
+    assert steg.read_bits(16) == "0000000000000001"
+    assert steg.read_bits(8) == steg.byteValue(ord("a"))
+
+
+def test_compare():
+    original = random_image(20, 30)
+    encoded = st.LSBSteganography(original.copy()).encode_text("Hello World!")
+    compare = st.Compare(original, encoded)
+    squared = (original.astype(float) - encoded.astype(float)) ** 2
+    assert compare.meanSquareError() == pytest.approx(squared.sum() / (20 * 30))
+    assert compare.psnr() == pytest.approx(20 * np.log10(255 / np.sqrt(squared.sum() / (20 * 30))))
+    results = compare.get_results()
+    assert results.mse == pytest.approx(squared.mean())
+    assert results.psnr == pytest.approx(20 * np.log10(255 / np.sqrt(squared.mean())))
+    assert results.summed_mse == compare.meanSquareError()
+    assert results.summed_psnr == compare.psnr()
+    assert results.channel_mse == pytest.approx(squared.mean(axis=(0, 1)))
+    assert results.channel_max_error.max() == 1
+    assert 0.99 < results.ssim < 1
+    assert st.Compare(original, original).get_results().ssim == pytest.approx(1)
+    assert st.Compare(original, original).psnr() == 100
+
+
+def test_compare_batch():
+    originals = np.stack([random_image(20, 30, seed=seed) for seed in range(4)])
+    encoded = originals.copy()
+    encoded[1] ^= 1
+    encoded[2, :10] = 0
+    results = st.Compare(originals, encoded).get_results()
+    assert results.mse.shape == (4,)
+    assert results.channel_mse.shape == (4, 3)
+    for i in range(4):
+        single = st.Compare(originals[i], encoded[i]).get_results()
+        assert results.mse[i] == pytest.approx(single.mse)
+        assert results.ssim[i] == pytest.approx(single.ssim)
+    assert results.mse[0] == 0 and results.psnr[0] == 100
+    assert results.mse[1] == pytest.approx(1)